@@ -27,3 +27,8 @@ def translate(languages=['il']):
 
 # Command specification
 ICON = 'reader.png'
+
+# Profiling: log the timings of the conversion stages, with the memory
+# peaks when PROFILE_MEMORY, slower
+PROFILE = False
+PROFILE_MEMORY = False
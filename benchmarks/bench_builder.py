@@ -0,0 +1,41 @@
+"""Compare the per note build cost of FreeMapBuilder with a timestamp
+computed per node, as before the build session clock, and once per
+document.
+
+    python -m benchmarks.bench_builder [notes]
+"""
+import datetime
+import sys
+import time
+
+from builders.mapbuilders import FreeMapBuilder, java_date, COUNTER_IDS
+
+
+class LegacyClockBuilder(FreeMapBuilder):
+    """FreeMapBuilder computing the timestamp of every node."""
+
+    def _now(self, created=None, **kwargs):
+        return java_date(datetime.datetime.now(tz=datetime.timezone.utc))
+
+
+def build(builder, notes):
+    """Return the seconds per note to build notes notes."""
+    builder.XMLroot()
+    builder.bookTitle('Synthetic book')
+    builder.sectionHeading('Chapter 1')
+    start = time.perf_counter()
+    for n in range(notes):
+        builder.noteHeading(f'Highlight(yellow) - Page {n // 10} · Location {n}')
+        builder.noteText('Lorem ipsum dolor sit amet.')
+    return (time.perf_counter() - start) / notes
+
+
+def main(notes):
+    legacy = build(LegacyClockBuilder(ids=COUNTER_IDS), notes)
+    session = build(FreeMapBuilder(ids=COUNTER_IDS), notes)
+    print(f'per node timestamp: {legacy * 1e6:7.2f} us/note')
+    print(f'session timestamp:  {session * 1e6:7.2f} us/note')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if sys.argv[1:] else 100000)
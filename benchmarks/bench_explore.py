@@ -0,0 +1,65 @@
+"""Compare the scaling of explore with the legacy parent list scan.
+
+    python -m benchmarks.bench_explore [nodes ...]
+"""
+import sys
+import time
+
+from builders.mapbuilders import explore, node_text, SECTION
+from benchmarks.synthetic import internal_map
+
+# The legacy explore is quadratic: skip it above this number of nodes
+LEGACY_LIMIT = 20000
+
+
+def legacy_explore(document):
+    """explore before the depth tracking rewrite."""
+    text = ''
+    root = document.getroot()
+    parents = [root]
+    node_level = 0
+    level = 0
+    count = 0
+    for node in root.iter('*'):
+        p = [i for i in range(0, len(parents)) if node in list(parents[i])]
+        if p:
+            level = p[0] + 1
+            if len(parents) > level:
+                parents[level] = node
+            else:
+                parents.append(node)
+        if '_node_type' in node.attrib and node.attrib['_node_type'] == SECTION:
+            count = max(int(node.attrib['_section_counter']), count)
+            node_level = max(int(node.attrib['_node_level']), node_level)
+        else:
+            node_level = max(level, node_level)
+        text += node_text(node, level)
+    return {'text': text,
+            'parents': parents,
+            'max_node_level': node_level,
+            'max_section_counter': count}
+
+
+def timed(fn, document):
+    start = time.perf_counter()
+    result = fn(document)
+    return result, time.perf_counter() - start
+
+
+def main(sizes):
+    print(f'{"nodes":>8} {"legacy":>10} {"explore":>10}')
+    for nodes in sizes:
+        # Each note is a text and a heading node, each one with a font
+        document = internal_map(notes=max(1, nodes // 4))
+        size = sum(1 for _ in document.iter())
+        result, elapsed = timed(explore, document)
+        legacy = '-'
+        if size <= LEGACY_LIMIT:
+            expected, l_elapsed = timed(legacy_explore, document)
+            assert expected == result
+            legacy = f'{l_elapsed:.3f}s'
+        print(f'{size:>8} {legacy:>10} {elapsed:>9.3f}s')
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [1000, 10000, 100000])
@@ -0,0 +1,46 @@
+"""Compare the memory of the internal map built as an ElementTree and as
+the records of the map model.
+
+    python -m benchmarks.bench_model [notes ...]
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from builders.mapbuilders import NotesParser
+from builders.mapmodel import ModelBuilder
+from benchmarks.synthetic import write_kindle_notes
+
+
+def measure(file, builder):
+    """Return the memory kept by the parsed document and the parse time."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    document = NotesParser(stream=True, builder=builder).parse(file)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert document is not None
+    return size, elapsed
+
+
+def main(sizes):
+    print(f'{"notes":>8} {"tree B/note":>12} {"model B/note":>13} '
+          f'{"tree":>8} {"model":>8}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for notes in sizes:
+            file = write_kindle_notes(os.path.join(tmp, f'notes_{notes}.html'),
+                                      sections=max(1, notes // 10), notes=notes)
+            tree, t_time = measure(file, None)
+            model, m_time = measure(file, ModelBuilder)
+            print(f'{notes:>8} {tree / notes:>12.0f} {model / notes:>13.0f} '
+                  f'{t_time:>7.2f}s {m_time:>7.2f}s')
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [1000, 10000, 50000])
@@ -0,0 +1,73 @@
+"""Compare the legacy double parse of NotesParser.parse with the
+bounded prefix sniffing and with the streaming parser.
+
+    python -m benchmarks.bench_parse [notes ...]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import bs4
+from bs4 import BeautifulSoup
+
+import builders.mapbuilders as mb
+from benchmarks.synthetic import write_kindle_notes
+
+
+class CountingSoup(BeautifulSoup):
+    """BeautifulSoup counting the number of full parses."""
+    count = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingSoup.count += 1
+        super().__init__(*args, **kwargs)
+
+
+def legacy_parse(parser, file):
+    """NotesParser.parse before sniffing: a full parse for detection."""
+    with open(file=file, encoding='UTF-8') as f:
+        soup = bs4.BeautifulSoup(f, features="html.parser")
+    if soup.find('html') and soup.select('div[class="bookTitle"]'):
+        return parser.parse_html(file)
+    elif soup.find('map') and soup.find('node'):
+        return parser.parse_xml(file)
+    return None
+
+
+def measure(fn, file, **kwargs):
+    """Return the number of soup parses, the time and the peak memory."""
+    CountingSoup.count = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    document = fn(mb.NotesParser(**kwargs), file)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    assert document is not None
+    return CountingSoup.count, elapsed, peak
+
+
+def row(count, elapsed, peak):
+    return f'{count:>3} x {elapsed:>7.3f}s {peak:>7.1f}MB'
+
+
+def main(sizes):
+    bs4.BeautifulSoup = CountingSoup
+    print(f'{"notes":>8} {"size MB":>8} {"legacy":>25} '
+          f'{"sniffed":>25} {"streamed":>25}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for notes in sizes:
+            file = write_kindle_notes(os.path.join(tmp, f'notes_{notes}.html'),
+                                      sections=max(1, notes // 10), notes=notes)
+            size = os.path.getsize(file) / 2**20
+            legacy = measure(legacy_parse, file)
+            sniffed = measure(mb.NotesParser.parse, file)
+            streamed = measure(mb.NotesParser.parse, file, stream=True)
+            print(f'{notes:>8} {size:>8.1f} {row(*legacy)} '
+                  f'{row(*sniffed)} {row(*streamed)}')
+
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [1000, 10000, 50000])
@@ -0,0 +1,84 @@
+"""Measure the startup: the import time of the builders modules and the
+time to the first frame of the app, each in a new interpreter.
+
+    python -m benchmarks.bench_startup [runs]
+
+The modules imported with a builders module are checked not to include
+the GUI and the soup parser. The first frame needs Kivy and a display,
+it is skipped without them.
+"""
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ('builders.mapbuilders', 'builders.__main__')
+# Modules a headless import must not load
+HEAVY = ('kivy', 'bs4')
+
+IMPORT = '''
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(' '.join(m for m in {heavy!r} if m in sys.modules))
+'''
+
+FIRST_FRAME = '''
+import time
+start = time.perf_counter()
+import kindlenotes
+from kivy.clock import Clock
+app = kindlenotes.KindleNotesApp()
+
+def first_frame(dt):
+    print(time.perf_counter() - start)
+    app.stop()
+
+# Called at the next frame, once the first one is drawn
+Clock.schedule_once(lambda dt: Clock.schedule_once(first_frame, 0), 0)
+app.run()
+'''
+
+
+def run(code):
+    """Run code in a new interpreter from the repository root and return
+    its output lines, None when it fails."""
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT,
+                            capture_output=True, text=True)
+    if result.returncode:
+        return None
+    return result.stdout.splitlines()
+
+
+def best(code, runs):
+    """Return the best time printed by code over runs and the last output
+    lines, None when it fails."""
+    times = []
+    lines = None
+    for _ in range(runs):
+        lines = run(code)
+        if lines is None:
+            return None, None
+        times.append(float(lines[0]))
+    return min(times), lines[1:]
+
+
+def main(runs=5):
+    for module in MODULES:
+        seconds, lines = best(IMPORT.format(module=module, heavy=HEAVY), runs)
+        if seconds is None:
+            print(f'{"import " + module:<32} failed')
+            continue
+        loaded = lines[0] if lines and lines[0] else 'none'
+        print(f'{"import " + module:<32} {seconds * 1000:>8.1f} ms   '
+              f'heavy modules loaded: {loaded}')
+    seconds, _ = best(FIRST_FRAME, runs)
+    if seconds is None:
+        print(f'{"first frame":<32} skipped: Kivy or a display missing')
+    else:
+        print(f'{"first frame":<32} {seconds * 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main(*[int(n) for n in sys.argv[1:2]])
@@ -0,0 +1,183 @@
+"""Time and memory-profile the conversion stages on synthetic Kindle
+notes exports and their FreeMind maps, and compare with a baseline.
+
+    python -m benchmarks.run [--sizes N ...] [--output JSON]
+                             [--baseline JSON] [--tolerance RATIO]
+
+Stages, for each number of notes:
+
+    - parse.html: NotesParser.parse of the Kindle notes, streamed
+    - parse.soup: the same with BeautifulSoup, with --soup
+    - parse.mm: NotesParser.parse of the FreeMind map
+    - parse.mm.lean: the same keeping only the attributes used by the app
+    - explore: explore of the map
+    - remove_pages: remove_pages of the map, in place
+    - et.write: ElementTree.write of the map
+
+A stage time is the best of --repeat runs, its memory peak is traced by
+tracemalloc in a separate run, as tracing slows it down.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from copy import deepcopy
+
+from builders.mapbuilders import NotesParser, explore, remove_pages
+from benchmarks.synthetic import write_kindle_notes
+
+SIZES = (1000, 10000, 100000)
+# Notes per section of the synthetic exports
+PER_SECTION = 50
+
+
+def measure(setup, function, repeat=3, memory=True):
+    """Return the best time of function(setup()) over repeat runs and its
+    memory peak in MiB, None without memory. setup is not measured."""
+    best = None
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if memory:
+        argument = setup()
+        tracemalloc.start()
+        function(argument)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_mb': peak}
+
+
+def parse(file, **kwargs):
+    """Return a function parsing file with a NotesParser made with the
+    keywords, failing as the parsing does."""
+    def function(_):
+        parser = NotesParser(**kwargs)
+        document = parser.parse(file)
+        if document is None:
+            raise RuntimeError('; '.join(parser.getlogs()))
+        return document
+    return function
+
+
+def run_size(tmp, notes, words=20, repeat=3, memory=True, soup=False):
+    """Return the results of the stages for a synthetic export of notes
+    notes: {stage: {'seconds', 'peak_mb'}}."""
+    html = write_kindle_notes(os.path.join(tmp, f'notes_{notes}.html'),
+                              sections=max(1, notes // PER_SECTION),
+                              notes=notes, words=words)
+    document = parse(html, stream=True)(None)
+    mm = os.path.join(tmp, f'notes_{notes}.mm')
+    document.write(mm, encoding='utf-8')
+    out = os.path.join(tmp, 'out.mm')
+
+    def same():
+        return document
+
+    def fresh():
+        return deepcopy(document)
+
+    stages = [('parse.html', same, parse(html, stream=True)),
+              ('parse.mm', same, parse(mm)),
+              ('parse.mm.lean', same, parse(mm, lean=True)),
+              ('explore', same, explore),
+              ('remove_pages', fresh, remove_pages),
+              ('et.write', same, lambda d: d.write(out, encoding='utf-8'))]
+    if soup:
+        stages.insert(1, ('parse.soup', same, parse(html)))
+    results = {'_size_mb': os.path.getsize(html) / 2**20}
+    for name, setup, function in stages:
+        results[name] = measure(setup, function, repeat, memory)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print the ratio of the results to the baseline ones and return the
+    number of stages slower than the baseline beyond the tolerance."""
+    slower = 0
+    print(f'\n{"notes":>8} {"stage":<14} {"baseline":>10} {"now":>10} '
+          f'{"ratio":>7}')
+    for notes, stages in results.items():
+        for name, result in stages.items():
+            base = baseline.get(notes, {}).get(name)
+            if name.startswith('_') or not base:
+                continue
+            ratio = result['seconds'] / base['seconds']
+            flag = ''
+            if ratio > 1 + tolerance:
+                slower += 1
+                flag = ' slower'
+            print(f'{notes:>8} {name:<14} {base["seconds"]:>9.3f}s '
+                  f'{result["seconds"]:>9.3f}s {ratio:>6.2f}x{flag}')
+    return slower
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description='Benchmark the conversion stages on synthetic notes.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=SIZES,
+                        help='numbers of notes (default: %(default)s)')
+    parser.add_argument('--words', type=int, default=20,
+                        help='average words of a note (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of a stage, the best is kept '
+                        '(default: %(default)s)')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='do not trace the memory peaks')
+    parser.add_argument('--soup', action='store_true',
+                        help='also time the BeautifulSoup parser')
+    parser.add_argument('--output', default=None, metavar='JSON',
+                        help='write the results to a JSON file')
+    parser.add_argument('--baseline', default=None, metavar='JSON',
+                        help='compare with the results of a previous run')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='slowdown ratio tolerated by the comparison '
+                        '(default: %(default)s)')
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    results = {}
+    print(f'{"notes":>8} {"stage":<14} {"seconds":>10} {"peak MB":>9}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for notes in args.sizes:
+            stages = run_size(tmp, notes, words=args.words,
+                              repeat=args.repeat, memory=args.memory,
+                              soup=args.soup)
+            results[str(notes)] = stages
+            for name, result in stages.items():
+                if name.startswith('_'):
+                    continue
+                peak = result['peak_mb']
+                print(f'{notes:>8} {name:<14} {result["seconds"]:>9.3f}s '
+                      + (f'{peak:>9.1f}' if peak is not None else ''))
+    report = {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'words': args.words,
+              'repeat': args.repeat,
+              'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.output}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, baseline['results'], args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Synthetic Kindle notes exports for benchmarks."""
+import random
+
+HEAD = '''<!DOCTYPE html PUBLIC
+"-//W3C//DTD XHTML 1.0 Strict//EN"
+"XHTML1-s.dtd" >
+<html xmlns="http://www.w3.org/TR/1999/REC-html-in-xml" xml:lang="en" lang="en">
+    <head>
+    <meta charset="UTF-8">
+    <title>Notes</title>
+    </head>
+    <body>
+        <div class="bodyContainer">
+            <div class="notebookFor">
+                Notebook Export
+            </div>
+            <div class="bookTitle">
+                {title}
+            </div>
+            <div class="authors">
+                {authors}
+            </div>
+            <div class="citation">
+                Citation (APA): {authors} (2020). <i>{title}</i> [Kindle version]. Retrieved from Amazon.com
+            </div>
+            <hr />
+'''
+SECTION = '''<div class="sectionHeading">
+    {text}
+</div>'''
+NOTE = '''<div class="noteHeading">
+    Highlight(<span class="highlight_{colour}">{colour}</span>) - Page {page} · Location {location}
+</div>
+<div class="noteText">
+    {text}
+</div>'''
+TAIL = '''
+        </div>
+    </body>
+</html>
+'''
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do '
+         'eiusmod tempor incididunt ut labore et dolore magna aliqua').split()
+COLOURS = ('yellow', 'blue', 'pink', 'orange')
+
+
+def sentence(rnd, words):
+    return ' '.join(rnd.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def kindle_notes(sections=30, notes=300, words=20, title='Synthetic book',
+                 authors='Doe, John', seed=0):
+    """Yield the chunks of a Kindle notes export with the given number of
+    sections and notes, each note text made of about words words."""
+    rnd = random.Random(seed)
+    yield HEAD.format(title=title, authors=authors)
+    per_section = max(1, notes // max(1, sections))
+    location = 1
+    for s in range(sections):
+        yield SECTION.format(text=f'Chapter {s + 1}')
+        count = per_section if s < sections - 1 else notes - per_section * s
+        for _ in range(max(0, count)):
+            location += rnd.randint(1, 20)
+            yield NOTE.format(colour=rnd.choice(COLOURS),
+                              page=location // 10 + 1,
+                              location=location,
+                              text=sentence(rnd, rnd.randint(1, 2 * words)))
+    yield TAIL
+
+
+def write_kindle_notes(file, **kwargs):
+    """Write a synthetic Kindle notes export to file, see kindle_notes."""
+    with open(file, 'w', encoding='UTF-8') as f:
+        for chunk in kindle_notes(**kwargs):
+            f.write(chunk)
+    return file
+
+
+def internal_map(notes=1000, sections=None, words=20, seed=0):
+    """Return an internal map ElementTree built by FreeMapBuilder with the
+    given number of notes, each one made of a text and a page heading."""
+    from builders.mapbuilders import FreeMapBuilder
+    rnd = random.Random(seed)
+    sections = sections or max(1, notes // 10)
+    builder = FreeMapBuilder()
+    builder.XMLroot()
+    builder.bookTitle('Synthetic book')
+    builder.authors('Doe, John')
+    builder.citation('Citation (APA): Doe, J. (2020). Synthetic book')
+    per_section = max(1, notes // sections)
+    for n in range(notes):
+        if n % per_section == 0:
+            builder.sectionHeading(f'Chapter {n // per_section + 1}')
+        builder.noteHeading(f'Highlight(yellow) - Page {n // 10 + 1} · Location {n}')
+        builder.noteText(sentence(rnd, rnd.randint(1, 2 * words)))
+    return builder.get_document()
@@ -0,0 +1,322 @@
+"""Headless command line:
+
+    python -m builders convert [options] FILE_OR_DIR [FILE_OR_DIR ...]
+    python -m builders library [options] -o MAP FILE_OR_DIR [FILE_OR_DIR ...]
+    python -m builders watch [options] DIR
+    python -m builders clear-cache [--cache DIR]
+    python -m builders index [--index FILE] FILE_OR_DIR [FILE_OR_DIR ...]
+    python -m builders search [--index FILE] [--limit N] QUERY
+"""
+import argparse
+import os
+import sys
+
+from .batch import find_files, convert_files, FORMATS, MM
+from .mapbuilders import NotesParser, ID_STRATEGIES, HASH_IDS
+from .mapcache import MapCache, DEFAULT_DIR
+from .mapfilters import MapFilter
+from .maplibrary import write_library
+from .mapprofile import Profiler
+from .mapsearch import NotesIndex, DEFAULT_INDEX
+from .mapwatch import Watcher, INTERVAL, SETTLE
+
+
+def convert(args):
+    """Convert the files, print a summary line per file and return the
+    exit code: 1 if any conversion failed."""
+    files = find_files(args.paths, recursive=args.recursive)
+    if not files:
+        print('No files to convert', file=sys.stderr)
+        return 1
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    options = {'section_range': args.sections,
+               'page_range': args.page_range,
+               'location_range': args.location_range,
+               'level_low': args.level,
+               'pages': args.pages,
+               'summary': args.summary,
+               'merge': args.merge,
+               'ids': args.ids,
+               'dedupe': args.dedupe,
+               'format': args.format or [MM],
+               'profile': bool(args.profile),
+               'memory': args.memory}
+    profiler = Profiler(cprofile=args.cprofile)
+    # cProfile sees this process only: convert the files here
+    workers = 1 if args.cprofile else args.workers
+    failed = 0
+    profiler.start()
+    for summary in convert_files(files, workers=workers,
+                                 output=args.output, cache=args.cache,
+                                 **options):
+        profiler.merge(summary.get('profile', {}))
+        if summary['ok']:
+            print('ok     %s -> %s (%d nodes, %.2fs)' % (
+                summary['file'], ', '.join(summary['outputs']),
+                summary['nodes'],
+                summary['seconds']))
+        else:
+            failed += 1
+            print('FAILED %s' % (summary['file']))
+        for log in summary['logs']:
+            print('       > %s' % (log))
+    profiler.stop()
+    print('%d converted, %d failed' % (len(files) - failed, failed))
+    if args.profile:
+        profiler.dump(args.profile)
+        for line in profiler.lines():
+            print('       %s' % (line))
+        print('Profile written to %s' % (args.profile))
+    return 1 if failed else 0
+
+
+def library(args):
+    """Write the files to a single library map, print a summary line per
+    file and return the exit code: 1 if any file failed."""
+    files = find_files(args.paths, recursive=args.recursive)
+    if not files:
+        print('No files to convert', file=sys.stderr)
+        return 1
+    skip = MapFilter(section_range=args.sections, level_low=args.level,
+                     pages=args.pages, summary=args.summary,
+                     page_range=args.page_range,
+                     location_range=args.location_range)
+    summaries = write_library(files, args.output, title=args.title,
+                              workers=args.workers, window=args.window,
+                              skip=skip, ids=args.ids, cache=args.cache,
+                              dedupe=args.dedupe)
+    failed = 0
+    for summary in summaries:
+        if summary['ok']:
+            print('ok     %s (%d nodes, %.2fs)' % (
+                summary['file'], summary['nodes'], summary['seconds']))
+        else:
+            failed += 1
+            print('FAILED %s' % (summary['file']))
+        for log in summary['logs']:
+            print('       > %s' % (log))
+    print('%d books written to %s, %d failed' % (
+        len(files) - failed, args.output, failed))
+    return 1 if failed else 0
+
+
+def watch(args):
+    """Convert the files dropped into the directory until interrupted,
+    logging the events as JSON lines; return 1 if any conversion failed."""
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    watcher = Watcher(args.directory, output=args.output, cache=args.cache,
+                      workers=args.workers, window=args.window,
+                      interval=args.interval, settle=args.settle,
+                      recursive=args.recursive, state=args.state,
+                      section_range=args.sections, level_low=args.level,
+                      pages=args.pages, summary=args.summary,
+                      page_range=args.page_range,
+                      location_range=args.location_range,
+                      merge=args.merge, ids=args.ids, dedupe=args.dedupe,
+                      format=args.format or [MM])
+    return 1 if watcher.run(once=args.once) else 0
+
+
+def clear_cache(args):
+    """Delete the cached maps."""
+    print('%d cached maps deleted' % (MapCache(args.cache).clear()))
+    return 0
+
+
+def index(args):
+    """Index the notes of the files, the unchanged ones are skipped."""
+    files = find_files(args.paths, recursive=args.recursive,
+                       extensions=('.html', '.mm'))
+    notes_index = NotesIndex(args.index)
+    failed = 0
+    for file in files:
+        parser = NotesParser(stream=True, lean=True)
+        try:
+            notes = notes_index.add_file(file, parser)
+        except Exception as e:
+            parser.logs.append(f'{e}')
+            notes = None
+        if notes is not None:
+            print('indexed   %s (%d notes)' % (file, notes))
+        elif parser.getlogs():
+            failed += 1
+            print('FAILED    %s' % (file))
+            for log in parser.getlogs():
+                print('          > %s' % (log))
+        else:
+            print('unchanged %s' % (file))
+    notes_index.close()
+    return 1 if failed else 0
+
+
+def search(args):
+    """Print the notes best matching the query."""
+    notes_index = NotesIndex(args.index)
+    results = notes_index.search(' '.join(args.query), limit=args.limit)
+    for result in results:
+        print('%s / %s / %s' % (
+            result['book'], result['section'], result['heading']))
+        print('    %s' % (result['snippet']))
+    notes_index.close()
+    return 0 if results else 1
+
+
+def add_filter_arguments(cmd):
+    """Add the MapFilter options to a command."""
+    cmd.add_argument('--no-pages', dest='pages', action='store_false',
+                     help='leave out page and position headings')
+    cmd.add_argument('--summary', action='store_true',
+                     help='write the sections only, without the notes')
+    cmd.add_argument('--sections', nargs=2, metavar=('LOW', 'HIGH'),
+                     default=None, help='range of sections to include')
+    cmd.add_argument('--level', default=None,
+                     help='deepest node level to include')
+    cmd.add_argument('--page-range', nargs=2, metavar=('LOW', 'HIGH'),
+                     default=None, help='range of pages of the notes to '
+                     'include')
+    cmd.add_argument('--location-range', nargs=2, metavar=('LOW', 'HIGH'),
+                     default=None, help='range of locations of the notes '
+                     'to include')
+    cmd.add_argument('--dedupe', action='store_true',
+                     help='collapse the notes repeating another note of '
+                     'their section')
+
+
+def parser():
+    """Return the command line parser."""
+    parser = argparse.ArgumentParser(
+        prog='python -m builders',
+        description='Convert Kindle notes files to FreeMind maps.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    cmd = commands.add_parser(
+        'convert', help='convert files or directories of Kindle notes')
+    cmd.add_argument('paths', nargs='+', metavar='FILE_OR_DIR',
+                     help='Kindle notes files or directories of .html files')
+    cmd.add_argument('-w', '--workers', type=int, default=None,
+                     help='worker processes (default: one per CPU)')
+    cmd.add_argument('-o', '--output', default=None,
+                     help='output directory (default: next to each file)')
+    cmd.add_argument('-r', '--recursive', action='store_true',
+                     help='search the directories recursively')
+    add_filter_arguments(cmd)
+    cmd.add_argument('-f', '--format', choices=FORMATS, action='append',
+                     help='output format, repeat it for several outputs '
+                     'written in one pass (default: %s)' % (MM))
+    cmd.add_argument('--ids', choices=ID_STRATEGIES, default=HASH_IDS,
+                     help='node IDs: content hash, counter or random '
+                     '(default: %(default)s)')
+    cmd.add_argument('--merge', action='store_true',
+                     help='append only the new notes to the existing maps')
+    cmd.add_argument('--cache', default=DEFAULT_DIR,
+                     help='cache directory of the built maps (default: %(default)s)')
+    cmd.add_argument('--no-cache', dest='cache', action='store_const',
+                     const=None, help='do not use the cache')
+    cmd.add_argument('--profile', default=None, metavar='JSON',
+                     help='write the timings, counts and memory peaks of '
+                     'the conversion stages to a JSON file')
+    cmd.add_argument('--memory', action='store_true',
+                     help='with --profile, also trace the memory peaks, '
+                     'slowing the conversion')
+    cmd.add_argument('--cprofile', action='store_true',
+                     help='with --profile, also write a cProfile of the '
+                     'run to JSON.pstats, converting in this process')
+    cmd.set_defaults(func=convert)
+
+    cmd = commands.add_parser(
+        'library', help='write many Kindle notes files to a single map')
+    cmd.add_argument('paths', nargs='+', metavar='FILE_OR_DIR',
+                     help='Kindle notes files or directories of .html files')
+    cmd.add_argument('-o', '--output', required=True, metavar='MAP',
+                     help='library map file')
+    cmd.add_argument('-t', '--title', default='Library',
+                     help='library center node text (default: %(default)s)')
+    cmd.add_argument('-w', '--workers', type=int, default=None,
+                     help='worker processes (default: one per CPU)')
+    cmd.add_argument('--window', type=int, default=None,
+                     help='books parsed ahead of the one being written '
+                     '(default: twice the workers)')
+    cmd.add_argument('-r', '--recursive', action='store_true',
+                     help='search the directories recursively')
+    add_filter_arguments(cmd)
+    cmd.add_argument('--ids', choices=ID_STRATEGIES, default=HASH_IDS,
+                     help='node IDs: content hash, counter or random '
+                     '(default: %(default)s)')
+    cmd.add_argument('--cache', default=DEFAULT_DIR,
+                     help='cache directory of the built maps (default: %(default)s)')
+    cmd.add_argument('--no-cache', dest='cache', action='store_const',
+                     const=None, help='do not use the cache')
+    cmd.set_defaults(func=library)
+
+    cmd = commands.add_parser(
+        'watch', help='convert the Kindle notes files dropped into a '
+        'directory as they appear')
+    cmd.add_argument('directory', help='directory of the .html files')
+    cmd.add_argument('-w', '--workers', type=int, default=None,
+                     help='worker processes (default: one per CPU)')
+    cmd.add_argument('--window', type=int, default=None,
+                     help='files converted at once, the others are queued '
+                     '(default: twice the workers)')
+    cmd.add_argument('-o', '--output', default=None,
+                     help='output directory (default: next to each file)')
+    cmd.add_argument('-r', '--recursive', action='store_true',
+                     help='watch the subdirectories too')
+    cmd.add_argument('--interval', type=float, default=INTERVAL,
+                     help='seconds between two scans (default: %(default)s)')
+    cmd.add_argument('--settle', type=float, default=SETTLE,
+                     help='seconds a file must stay unchanged before it is '
+                     'converted (default: %(default)s)')
+    cmd.add_argument('--state', default=None,
+                     help='state file of the converted files (default: in '
+                     'the output directory)')
+    cmd.add_argument('--once', action='store_true',
+                     help='exit once the files found are converted')
+    add_filter_arguments(cmd)
+    cmd.add_argument('-f', '--format', choices=FORMATS, action='append',
+                     help='output format, repeat it for several outputs '
+                     '(default: %s)' % (MM))
+    cmd.add_argument('--ids', choices=ID_STRATEGIES, default=HASH_IDS,
+                     help='node IDs: content hash, counter or random '
+                     '(default: %(default)s)')
+    cmd.add_argument('--merge', action='store_true',
+                     help='append only the new notes to the existing maps')
+    cmd.add_argument('--cache', default=DEFAULT_DIR,
+                     help='cache directory of the built maps (default: %(default)s)')
+    cmd.add_argument('--no-cache', dest='cache', action='store_const',
+                     const=None, help='do not use the cache')
+    cmd.set_defaults(func=watch)
+
+    cmd = commands.add_parser('clear-cache', help='delete the cached maps')
+    cmd.add_argument('--cache', default=DEFAULT_DIR,
+                     help='cache directory (default: %(default)s)')
+    cmd.set_defaults(func=clear_cache)
+
+    cmd = commands.add_parser('index', help='index the notes for search')
+    cmd.add_argument('paths', nargs='+', metavar='FILE_OR_DIR',
+                     help='notes files or directories of .html and .mm files')
+    cmd.add_argument('-r', '--recursive', action='store_true',
+                     help='search the directories recursively')
+    cmd.add_argument('--index', default=DEFAULT_INDEX,
+                     help='index database (default: %(default)s)')
+    cmd.set_defaults(func=index)
+
+    cmd = commands.add_parser('search', help='search the indexed notes')
+    cmd.add_argument('query', nargs='+',
+                     help='words to find, "a phrase" between double quotes')
+    cmd.add_argument('-n', '--limit', type=int, default=20,
+                     help='maximum number of results (default: %(default)s)')
+    cmd.add_argument('--index', default=DEFAULT_INDEX,
+                     help='index database (default: %(default)s)')
+    cmd.set_defaults(func=search)
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
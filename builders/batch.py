@@ -0,0 +1,156 @@
+"""
+- Batch conversion: convert Kindle notes files to FreeMind maps without
+  the GUI, in parallel over a process pool.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .mapbuilders import NotesParser, sniff, HTML, XML
+from .mapcache import MapCache
+from .mapexporters import EXPORTERS, export, exporter
+from .mapfilters import MapFilter
+from .mapmerge import merge_document
+from .mapmodel import ModelBuilder
+from .mapprofile import Profiler, NULL_PROFILER
+from .mapwriters import iter_events, write_notes
+
+# Extensions converted when a directory is given
+EXTENSIONS = ('.html',)
+# Output formats, see mapexporters
+MM = 'mm'
+FORMATS = tuple(EXPORTERS)
+
+
+def is_output(file, extensions=EXTENSIONS):
+    """Return True for a file named as an output of a converted file:
+    <file><extension>.<format>, as notes.html.html."""
+    name, format = os.path.splitext(file)
+    return format[1:].lower() in FORMATS and \
+        os.path.splitext(name)[1].lower() in extensions
+
+
+def find_files(paths, recursive=False, extensions=EXTENSIONS):
+    """Return the files to convert: the given files and the files with the
+    given extensions found in the given directories, leaving out the
+    outputs of the converted files, see is_output."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            if recursive:
+                found = [os.path.join(d, f) for d, _, names in os.walk(path)
+                         for f in names]
+            else:
+                found = [os.path.join(path, f) for f in os.listdir(path)]
+            files.extend(sorted(f for f in found if os.path.isfile(f) and
+                                os.path.splitext(f)[1].lower() in extensions
+                                and not is_output(f, extensions)))
+        else:
+            files.append(path)
+    return files
+
+
+def output_file(file, output=None, format=MM):
+    """Return the output file of file: <file>.<format>, in the output
+    directory when given."""
+    mm = '%s.%s' % (file, format)
+    if output:
+        mm = os.path.join(output, os.path.basename(mm))
+    return mm
+
+
+def convert_file(file, output=None, cache=None, merge=False, ids=None,
+                 format=MM, dedupe=False, profile=False, memory=False,
+                 **options):
+    """Convert a file to a FreeMind map, or to the format, or to each one
+    of a list of formats in a single walk of the map, see mapexporters;
+    options are the MapFilter ones.
+    The node IDs are made with the ids strategy, see IDGenerator. With
+    dedupe the repeated notes are collapsed, see FreeMapBuilder.
+    The maps are cached in the cache directory when given. With merge, the
+    new notes are appended to the map when it exists. Without merge, Kindle
+    notes are written to a FreeMind map while parsed, in constant memory,
+    and to the cache, see write_notes; to the other formats, they are
+    built as a MapModel and exported. Of a FreeMind file, only the
+    sections in the section range are loaded.
+    Return a summary dictionary: file, map, outputs, ok, nodes, the
+    number of nodes written after filtering, seconds, logs and, with profile, the Profiler report of the conversion stages,
+    with their memory peaks when memory is true."""
+    start = time.perf_counter()
+    summary = {'file': file, 'map': None, 'outputs': [], 'ok': False,
+               'nodes': 0, 'seconds': 0.0, 'logs': []}
+    profiler = Profiler(memory=memory).start() if profile else NULL_PROFILER
+    formats = [format] if isinstance(format, str) else list(format)
+    try:
+        file_format = sniff(file)
+        sections = options.get('section_range') if file_format == XML else None
+        # Merging and FreeMind files need the ElementTree of the map
+        model = file_format == HTML and not merge
+        parser = NotesParser(stream=True, ids=ids, dedupe=dedupe,
+                             sections=sections,
+                             builder=ModelBuilder if model else None,
+                             cache=MapCache(cache) if cache else None,
+                             profiler=profiler)
+        outputs = [output_file(file, output, f) for f in formats]
+        map_filter = MapFilter(**options)
+        skip = profiler.wrap(map_filter, 'filter')
+        if formats == [MM] and not merge and file_format == HTML:
+            nodes = write_notes(parser, file, outputs[0], skip=skip)
+            summary['logs'] = parser.getlogs()
+            if nodes is not None:
+                summary.update(map=outputs[0], outputs=outputs, nodes=nodes,
+                               ok=True)
+        else:
+            document = parser.parse(file)
+            summary['logs'] = parser.getlogs()
+            if document:
+                map_filter.prepare(document)
+                exporters = []
+                for f, out in zip(formats, outputs):
+                    if f == MM and merge and os.path.exists(out):
+                        with profiler.stage('merge'):
+                            sections, notes = merge_document(
+                                document, out, skip=skip)
+                        summary['logs'].append(
+                            f'Merged {notes} new notes, '
+                            f'{sections} new sections')
+                    else:
+                        exporters.append(exporter(f, out))
+                if exporters:
+                    with profiler.stage('write.' + '+'.join(
+                            e.EXTENSION[1:] for e in exporters)):
+                        nodes = export(document, exporters, skip=skip)
+                else:
+                    # The nodes an export would write, as counted by it
+                    nodes = sum(1 for start, e, _ in iter_events(
+                        document.getroot(), map_filter)
+                        if start and e.tag == 'node')
+                summary['map'] = outputs[0]
+                summary['outputs'] = outputs
+                summary['nodes'] = nodes
+                summary['ok'] = True
+    except Exception as e:
+        summary['logs'].append(f'{e}')
+    summary['seconds'] = time.perf_counter() - start
+    if profile:
+        profiler.stop()
+        summary['profile'] = profiler.report()
+    return summary
+
+
+def convert_files(files, workers=None, output=None, cache=None, **options):
+    """Convert the files over a pool of workers processes, None for one
+    per CPU, and yield the summaries in the files order."""
+    if workers == 1:
+        for file in files:
+            yield convert_file(file, output, cache, **options)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convert_file, file, output, cache, **options)
+                   for file in files]
+        for file, future in zip(files, futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {'file': file, 'map': None, 'ok': False, 'nodes': 0,
+                       'seconds': 0.0, 'logs': [f'{e}']}
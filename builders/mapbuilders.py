@@ -1,13 +1,22 @@
 """
 - Internal Map Builder: builds a map from a html kindle notes
 - Free Map Builder: builds a map from a Internal Map tree to FreeMind format
-- Html Map Builder: builds a map from a Internal Map tree to html format
 """
 import xml.etree.ElementTree as ET
-from bs4 import BeautifulSoup, Tag
+from html.parser import HTMLParser
 import random
+import codecs
 import datetime
+import hashlib
 import io
+import os
+import re
+import time
+from copy import deepcopy
+
+from .mapdedupe import Deduper
+from .mappositions import note_position, COLOR, PAGE, LOCATION
+from .mapprofile import NULL_PROFILER
 
 MAP = 'map'
 TITLE = 'title'
@@ -17,11 +26,148 @@ SECTION = 'section'
 HEADING = 'heading'
 TEXT = 'text'
 
+# Version of the built maps: change it when the maps built from the same
+# file change, it invalidates the cached maps
+BUILDER_VERSION = '3'
+
+# Node ID strategies
+RANDOM_IDS = 'random'
+COUNTER_IDS = 'counter'
+HASH_IDS = 'hash'
+ID_STRATEGIES = (RANDOM_IDS, COUNTER_IDS, HASH_IDS)
+# Builder keywords changing the built maps, part of the cache key
+BUILD_OPTIONS = ('ids', 'now', 'dedupe', 'lean', 'sections')
+# Node attributes used by the app, the ones kept by a lean map loading
+MAP_ATTRIBUTES = ('ID', 'TEXT', '_node_type', '_node_level',
+                  '_section_counter', COLOR, PAGE, LOCATION)
+
+# File formats
+HTML = 'html'
+XML = 'xml'
+# Bytes read to detect the file format
+SNIFF_SIZE = 64 * 1024
+# Bytes fed at once to the streaming parser
+CHUNK_SIZE = 64 * 1024
+# A class attribute including bookTitle, quoted or not, as the soup
+# parser finds it: the mark of a Kindle notes file
+BOOK_TITLE_CLASS = re.compile(
+    r'(?<![\w-])(?i:class)\s*=\s*(?:'
+    r'"(?:[^"]*\s)?bookTitle(?:\s[^"]*)?"|'
+    r"'(?:[^']*\s)?bookTitle(?:\s[^']*)?'|"
+    r'bookTitle(?=[\s/>]))')
+# Kindle notes div classes, each one handled by the builder method
+# with the same name
+DIV_CLASSES = ('bookTitle', 'authors', 'citation',
+               'sectionHeading', 'noteHeading', 'noteText')
+
 
 def ID():
     return 'ID_{rnd!s:0>}'.format(rnd=random.randint(0, 9999999999))
 
 
+class IDNumbers():
+    """The ID numbers used by a document, in constant memory: a Bloom
+    filter of bits bits. A number never added may be found, but an added
+    number is always found: taking the found numbers as used keeps the
+    IDs unique and, as the filter is deterministic, stable across builds.
+    """
+    BITS = 2**23
+    # Odd 64 bits multipliers of the three bit positions of a number
+    MULTIPLIERS = (0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F,
+                   0x165667B19E3779F9)
+
+    def __init__(self, bits=BITS, **kwargs):
+        super().__init__()
+        self.shift = 64 - (bits - 1).bit_length()
+        self.bits = bytearray(bits // 8)
+
+    def _positions(self, number):
+        return [((number * m) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+                for m in self.MULTIPLIERS]
+
+    def __contains__(self, number):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7))
+                   for p in self._positions(number))
+
+    def add(self, number):
+        bits = self.bits
+        for p in self._positions(number):
+            bits[p >> 3] |= 1 << (p & 7)
+
+
+class IDGenerator():
+    """Node IDs unique across a document, by strategy:
+
+        - RANDOM_IDS: random numbers, as ID()
+        - COUNTER_IDS: a counter, 1 for the first node of the document
+        - HASH_IDS: a hash of the node content, stable across builds
+
+    The ID of a node is got calling the generator with the node content
+    parts: on a collision the next free number is taken, so the IDs
+    depend only on the document content and order but for RANDOM_IDS.
+    The reserved IDs are kept in a set; the IDs made by the generator,
+    but for COUNTER_IDS, in IDNumbers, so the memory does not grow with
+    the document.
+    """
+
+    def __init__(self, strategy=RANDOM_IDS, **kwargs):
+        super().__init__()
+        if strategy not in ID_STRATEGIES:
+            raise ValueError(f'Unknown ID strategy: {strategy}')
+        self.strategy = strategy
+        self.ids = set()
+        # The counter IDs can only collide with the reserved ones
+        self.numbers = None if strategy == COUNTER_IDS else IDNumbers()
+        self.counter = 0
+
+    def reserve(self, ids):
+        """Mark the given IDs as used."""
+        self.ids.update(ids)
+
+    def __contains__(self, id):
+        """Return True for an ID used, reserved or made by the generator."""
+        if id in self.ids:
+            return True
+        if self.numbers is None or not id or not id.startswith('ID_') or \
+                not id[3:].isdigit():
+            return False
+        return int(id[3:]) in self.numbers
+
+    def __call__(self, *parts):
+        if self.strategy == COUNTER_IDS:
+            self.counter += 1
+            number = self.counter
+        elif self.strategy == HASH_IDS:
+            digest = hashlib.sha1('\x1f'.join(parts).encode('utf-8'))
+            number = int(digest.hexdigest()[:12], 16) % 10000000000
+        else:
+            number = random.randint(0, 9999999999)
+        numbers = self.numbers
+        id = f'ID_{number}'
+        while id in self.ids or (numbers is not None and number in numbers):
+            number = (number + 1) % 10000000000
+            id = f'ID_{number}'
+        if numbers is None:
+            self.counter = number
+        else:
+            numbers.add(number)
+        return id
+
+
+def ids_generator(ids=None):
+    """Return an IDGenerator from a strategy name, None for RANDOM_IDS,
+    or the given generator."""
+    if isinstance(ids, IDGenerator):
+        return ids
+    return IDGenerator(ids or RANDOM_IDS)
+
+
+def build_key(**kwargs):
+    """Return the text of the builder keywords changing the built maps."""
+    return ';'.join(f'{k}={kwargs.get(k)!s}' for k in BUILD_OPTIONS)
+
+
 def java_date(date):
     # 1, 1970, 00:00:00 GMT
     beginning = datetime.datetime(
@@ -34,95 +180,287 @@ def java_date(date):
 
 def node_text(element, level, length=70):
     if element.tag == 'node':
-        return f'\n{level}-{element.tag}> {element.attrib["TEXT"][:length]}...'
+        return f'\n{level}-{element.tag}> {element.get("TEXT")[:length]}...'
     else:
         return f'\n{level}-{element.tag}> ...'
 
 
-def explore(document):
+def explore(document, text=True):
     """
     Return a text representation, the parents list, the maximum 
     section depth, the maximun element depth.
+    With text False only the maximum section depth and element depth are
+    returned, without building the text and the parents list.
+
+    The document is visited once depth first in document order, the level
+    of each element is tracked on the stack.
     """
-    text = ''
+    lines = []
     root = document.getroot()
     parents = [root]
     node_level = 0
-    level = 0
     count = 0
-    _types = [MAP, TITLE, SECTION, TEXT, HEADING]
-    for node in root.iter('*'):
-        p = [i for i in range(0, len(parents)) if node in list(parents[i])]
-        if p:
-            level = p[0] + 1
+    stack = [(root, 0)]
+    while stack:
+        node, level = stack.pop()
+        if node.get('_node_type') == SECTION:
+            count = max(int(node.get('_section_counter')), count)
+            node_level = max(int(node.get('_node_level')), node_level)
+        else:
+            node_level = max(level, node_level)
+        stack.extend((child, level + 1) for child in reversed(node))
+        if not text:
+            continue
+        if level:
             if len(parents) > level:
                 parents[level] = node
             else:
                 parents.append(node)
-        if '_node_type' in node.attrib and node.attrib['_node_type'] == SECTION:
-            count = max(int(node.attrib['_section_counter']), count)
-            node_level = max(int(node.attrib['_node_level']), node_level)
-        else:
-            node_level = max(level, node_level)
-            # _type = _types[level] if level < len(_types) else ''
-            # _section_counter = _section_counter + 1 if level == 2 else 0
-            # attrib = {'_node_type': _type, '_node_level': f'{level}', '_section_counter': f'{_section_counter}'}
-
         # Text
-        text += node_text(node, level)
-    return {'text': text,
-            'parents': parents,
-            'max_node_level': node_level,
+        lines.append(node_text(node, level))
+    info = {'max_node_level': node_level,
             'max_section_counter': count}
+    if text:
+        info['text'] = ''.join(lines)
+        info['parents'] = parents
+    return info
+
 
+def is_page(element):
+    """Return True for a 'note heading' element."""
+    return element.get('_node_type') == HEADING
 
-def remove_pages(document):
-    """Remove the element 'note heading' from the document"""
-    s = ET.tostring(element=document.getroot(), encoding='utf-8')
-    root = ET.fromstring(s)
-    for element in root.iter('node'):
-        headings = [e for e in element.findall(
-            'node') if e.attrib.get('_node_type') == HEADING]
-        if headings:
-            element.remove(headings[0])
 
+def remove_pages(document, copy=False):
+    """Remove the elements 'note heading' from the document.
+    The document is changed in place, unless copy is True: then the
+    document is left untouched and a changed copy is returned."""
+    root = document.getroot()
+    if copy:
+        root = deepcopy(root)
+    headings = [(element, e) for element in root.iter('node')
+                for e in element if is_page(e)]
+    for element, heading in headings:
+        element.remove(heading)
+    return ET.ElementTree(root)
+
+
+def in_range(element, section_range):
+    """Return False for a section element out of the (low, high) section
+    counters range, None for an open end."""
+    if element.get('_node_type') != SECTION:
+        return True
+    low, high = section_range
+    try:
+        counter = int(element.get('_section_counter', 0))
+    except ValueError:
+        return True
+    return not ((low is not None and counter < int(low)) or
+                (high is not None and counter > int(high)))
+
+
+def load_map(file, section_range=None, attributes=None):
+    """Return the internal map ElementTree of a FreeMind file, read with
+    iterparse: the read elements are cleared as soon as copied, so only
+    the returned tree is held in memory.
+    With a (low, high) section_range, the sections out of the range are
+    left out, with their nodes, without being copied. With attributes,
+    only the nodes are copied, with the given attributes only, as
+    MAP_ATTRIBUTES."""
+    root = None
+    # (read element, copied element or None when left out) from the root
+    stack = []
+    for event, element in ET.iterparse(file, events=('start', 'end')):
+        if event == 'end':
+            _, copy = stack.pop()
+            if copy is not None and attributes is None:
+                # Complete at the end event only
+                copy.text = element.text
+                copy.tail = element.tail
+            element.clear()
+            if stack:
+                # The read element was the only child left of its parent
+                del stack[-1][0][:]
+            continue
+        if root is None:
+            root = ET.Element(element.tag, attrib=dict(element.attrib))
+            stack.append((element, root))
+            continue
+        parent = stack[-1][1]
+        copy = None
+        if parent is not None and (element.tag == 'node' or
+                                   attributes is None) and \
+                (section_range is None or in_range(element, section_range)):
+            if attributes is None:
+                attrib = dict(element.attrib)
+            else:
+                attrib = {k: element.get(k) for k in attributes
+                          if k in element.attrib}
+            copy = ET.SubElement(parent, element.tag, attrib=attrib)
+        stack.append((element, copy))
     return ET.ElementTree(root)
 
 
+def sniff(file, size=SNIFF_SIZE):
+    """Return the format of the file, HTML for a Kindle notes file or XML
+    for a FreeMind file, reading only the first size characters.
+    Return None when the format is unknown."""
+    with open(file=file, encoding='UTF-8') as f:
+        head = f.read(size)
+    if '<html' in head.lower() and BOOK_TITLE_CLASS.search(head):
+        return HTML
+    if '<map' in head and '<node' in head:
+        return XML
+    return None
+
+
+class KindleHTMLParser(HTMLParser):
+    """Incremental Kindle notes parser.
+
+    No tree is built: the text of a Kindle notes div is collected while
+    the document is fed and passed to the builder method named as the div
+    class when the div closes. As the DOM walk of NotesParser.parse_html
+    only the divs following the book title at its same level are handled.
+    The builder methods calls are timed by the profiler, when given.
+    """
+
+    def __init__(self, builder, logs, profiler=None):
+        super().__init__(convert_charrefs=True)
+        self.builder = builder
+        self.logs = logs
+        self.profiler = profiler
+        self.depth = 0
+        # Depth of the book title div, None until found
+        self.level = None
+        # Builder methods of the open notes div
+        self.methods = None
+        self.strings = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'div':
+            return
+        self.depth += 1
+        if self.methods is not None:
+            return
+        classes = (dict(attrs).get('class') or '').split()
+        if self.level is None and 'bookTitle' in classes:
+            self.level = self.depth
+        if self.depth == self.level:
+            self.methods = [c for c in DIV_CLASSES if c in classes]
+            self.strings = []
+
+    def handle_endtag(self, tag):
+        if tag != 'div':
+            return
+        if self.methods is not None and self.depth == self.level:
+            text = ''.join(self.strings)
+            for method in self.methods:
+                try:
+                    if self.profiler is None:
+                        getattr(self.builder, method)(text)
+                    else:
+                        start = time.perf_counter()
+                        getattr(self.builder, method)(text)
+                        self.profiler.add('build.' + method,
+                                          time.perf_counter() - start,
+                                          len(text))
+                except Exception as e:
+                    self.logs.append(f'{e}')
+            self.methods = None
+            self.strings = []
+        self.depth -= 1
+
+    def handle_data(self, data):
+        if self.methods:
+            self.strings.append(data)
+
+
 class NotesParser():
-    """Parse a Kindle notes file or a FreeMind file
+    """Parse a Kindle notes file or a FreeMind file.
+
+    Kindle notes are streamed through a KindleHTMLParser when the stream
+    keyword is True, otherwise parsed into a BeautifulSoup DOM.
+    The maps are looked up and stored in the MapCache given as the cache
+    keyword.
+    While streaming, the progress keyword is called with the parsed and
+    the total bytes, and parsing stops as soon as the cancel keyword, an
+    object like threading.Event, is set.
+    The stages of the parsing are timed by the profiler keyword, a
+    Profiler.
+    FreeMind files are loaded with load_map when the lean keyword is true,
+    keeping only the MAP_ATTRIBUTES of the nodes, or when the sections
+    keyword gives a (low, high) section range.
+    The builder keyword is the builder class, FreeMapBuilder by default:
+    the parsed documents are of its document type. The keywords are
+    passed to the builder, together with the parser logs.
     """
 
     def __init__(self, **kwargs):
         super().__init__()
         self.logs = []
         self.text = ''
+        self.stream = kwargs.get('stream', False)
+        self.cache = kwargs.get('cache', None)
+        self.progress = kwargs.get('progress', None)
+        self.cancel = kwargs.get('cancel', None)
+        self.builder = kwargs.get('builder', None) or FreeMapBuilder
+        self.profiler = kwargs.get('profiler', None) or NULL_PROFILER
+        self.kwargs = kwargs
 
     def parse(self, file):
         """Parse and return an ElementTree."""
         self.text = ''
         try:
-            with open(file=file, encoding='UTF-8') as f:
-                soup = BeautifulSoup(f, features="html.parser")
-            if soup.find('html') and soup.select('div[class="bookTitle"]'):
-                # return XmlMapDocument(self.parse_html(file))
-                return self.parse_html(file)
-            elif soup.find('map') and soup.find('node'):
-                # return XmlMapDocument(self.parse_xml(file))
-                return self.parse_xml(file)
-
+            key = None
+            profiler = self.profiler
+            if self.cache is not None:
+                with profiler.stage('cache.get') as stage:
+                    key = self.cache.key(file, build_key(**self.kwargs))
+                    document = self.cache.get(key)
+                if document is not None:
+                    stage['count'] += 1
+                    return self.builder.load(document)
+            with profiler.stage('sniff'):
+                file_format = sniff(file)
+            if file_format == HTML:
+                with profiler.stage('parse.html') as stage:
+                    document = self.parse_html(file)
+                    stage['count'] += os.path.getsize(file)
+            elif file_format == XML:
+                with profiler.stage('parse.xml') as stage:
+                    document = self.parse_xml(file)
+                    stage['count'] += os.path.getsize(file)
+            else:
+                self.logs.append(f'Unknown file format: {file}')
+                return None
+            if document is not None and key is not None:
+                with profiler.stage('cache.put'):
+                    self.cache.put(key, self.builder.dump(document))
+            return document
         except Exception as e:
             self.logs.append(f'{e}')
         return None
 
     def parse_xml(self, file):
-        return ET.parse(file)
-
-    def parse_html(self, file):
+        lean = self.kwargs.get('lean')
+        sections = self.kwargs.get('sections')
+        if lean or sections:
+            return self.builder.load(load_map(
+                file, sections, MAP_ATTRIBUTES if lean else None))
+        return self.builder.load(ET.parse(file))
+
+    def parse_html(self, file, soup=None):
+        """Parse a Kindle notes file and return an ElementTree.
+        An already parsed soup of the file is used when given."""
+        if soup is None and self.stream:
+            return self.parse_stream(file)
         try:
-            with open(file=file, encoding='UTF-8') as f:
-                soup = BeautifulSoup(f, features="html.parser")
-            builder = FreeMapBuilder()
+            # BeautifulSoup is slow to import: only the soup parsing needs it
+            from bs4 import BeautifulSoup, Tag
+            if soup is None:
+                with open(file=file, encoding='UTF-8') as f:
+                    soup = BeautifulSoup(f, features="html.parser")
+            builder = self.builder(logs=self.logs, **self.kwargs)
             builder.XMLroot()
             element = soup.find_all("div", class_="bookTitle", limit=1)[0]
             while element:
@@ -155,6 +493,42 @@ class NotesParser():
             self.logs.append(f'{e}')
         return None
 
+    def parse_stream(self, file):
+        """Parse a Kindle notes file without building a DOM and return
+        an ElementTree."""
+        try:
+            builder = self.builder(logs=self.logs, **self.kwargs)
+            builder.XMLroot()
+            if self.feed(file, builder):
+                return builder.get_document()
+        except Exception as e:
+            self.logs.append(f'{e}')
+        return None
+
+    def feed(self, file, builder):
+        """Stream a Kindle notes file to the methods of a builder.
+        Return False when cancelled."""
+        parser = KindleHTMLParser(
+            builder, self.logs,
+            self.profiler if self.profiler.enabled else None)
+        decoder = codecs.getincrementaldecoder('UTF-8')()
+        total = os.path.getsize(file)
+        done = 0
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                if self.cancel is not None and self.cancel.is_set():
+                    self.logs.append(f'Cancelled: {file}')
+                    return False
+                parser.feed(decoder.decode(chunk))
+                done += len(chunk)
+                if self.progress:
+                    self.progress(done, total)
+        parser.feed(decoder.decode(b'', final=True))
+        parser.close()
+        if parser.level is None:
+            raise ValueError(f'No book title found: {file}')
+        return True
+
     def getlogs(self):
         """Return the conversion logs"""
         return self.logs
@@ -164,6 +538,17 @@ class FreeMapBuilder():
     """
     Convert a HTML formatted file from Kindle Notes to an internal
     fomat similar to FreeMap raw formatted file.
+    The node IDs are made by the ids keyword, an IDGenerator or one of
+    its strategies, random by default.
+    The nodes CREATED and MODIFIED timestamps are the build time, taken
+    once per document, or the now keyword, a datetime or a Java time in
+    milliseconds. A builder method called with the created keyword, as
+    taken from the notes metadata, uses it for that node.
+    With the dedupe keyword, a note repeating another note of its section,
+    or within it, is collapsed into it, keeping the longer text; the
+    collapsed notes are reported in the logs keyword list.
+    The highlight colour, page and location of a note are parsed from its
+    page heading into the heading attributes, see note_position.
     """
 
     def __init__(self, **kwargs):
@@ -174,15 +559,65 @@ class FreeMapBuilder():
         self.node = None
         self.section_counter = 0
         self.kwargs = kwargs
+        self.ids = ids_generator(kwargs.get('ids'))
+        self.title = ''
+        self.section = ''
+        logs = kwargs.get('logs')
+        self.logs = [] if logs is None else logs
+        self.deduper = Deduper() if kwargs.get('dedupe') else None
+        now = kwargs.get('now')
+        if now is None:
+            now = datetime.datetime.now(tz=datetime.timezone.utc)
+        if isinstance(now, datetime.datetime):
+            now = java_date(now)
+        self.now = now
 
     def _formatText(self, element, **kwargs):
+        """Return the stripped text of a Kindle notes div, given as a
+        soup element or as its text."""
+        if isinstance(element, str):
+            return element.strip()
         if element.descendants:
             s = ''.join(element.strings).strip()
             return s if s else ''
-            # rif = re.findall(r'(\d+)', text)
-            # subchapter = re.findall(r'- (.*)>', text)
         return ''
 
+    def _now(self, created=None, **kwargs):
+        """Return the timestamp of a node: the created keyword, if any,
+        else the build time."""
+        return self.now if created is None else created
+
+    def _id(self, node_type, text):
+        """Return the ID of a node from its content."""
+        return self.ids(self.title, self.section, node_type, text)
+
+    def _collapse(self, text):
+        """Return True when text repeats a note of the section, or
+        contains it: the note then gets the longer text."""
+        if self.deduper is None:
+            return False
+        note = self.deduper.match(text, self._location())
+        if note is None:
+            return False
+        if len(text) > len(note.get('TEXT', '')):
+            self._set_text(note, text)
+            self.deduper.add(note, text)
+            self.logs.append(f'Merged a note into a longer one in section '
+                             f'{self.section}: {text[:60]}')
+        else:
+            self.logs.append(f'Collapsed a repeated note in section '
+                             f'{self.section}: {text[:60]}')
+        return True
+
+    def _location(self):
+        """Return the location of the note heading being added, None when
+        unknown."""
+        location = self.node.get(LOCATION) if self.node is not None else None
+        return None if location is None else int(location)
+
+    def _set_text(self, note, text):
+        note.set('TEXT', text)
+
     def XMLroot(self, element='map', **kwargs):
         # if root raise RootException
         attrib = {'version': "1.0.1"}
@@ -193,11 +628,12 @@ class FreeMapBuilder():
         self.root.insert(0, ET.Comment(text=text))
 
     def bookTitle(self, element, **kwargs):
-        now = java_date(datetime.datetime.now(tz=datetime.timezone.utc))
+        now = self._now(**kwargs)
         text = self._formatText(element)
+        self.title = text
         attrib = {'COLOR': "#000000",
                   'CREATED': str(now),
-                  'ID': ID(),
+                  'ID': self._id(TITLE, text),
                   'MODIFIED': str(now),
                   'TEXT': text,
                   '_node_type': TITLE,
@@ -209,11 +645,11 @@ class FreeMapBuilder():
         return text
 
     def authors(self, element, **kwargs):
-        now = java_date(datetime.datetime.now(tz=datetime.timezone.utc))
+        now = self._now(**kwargs)
         text = self._formatText(element)
         attrib = {'COLOR': "#0033ff",
                   'CREATED': str(now),
-                  'ID': ID(),
+                  'ID': self._id(AUTHORS, text),
                   'FOLDED': "false",
                   #   'LINK': "",
                   'MODIFIED': str(now),
@@ -226,11 +662,11 @@ class FreeMapBuilder():
         return text
 
     def citation(self, element, **kwargs):
-        now = java_date(datetime.datetime.now(tz=datetime.timezone.utc))
+        now = self._now(**kwargs)
         text = self._formatText(element)
         attrib = {'COLOR': "#0033ff",
                   'CREATED': str(now),
-                  'ID': ID(),
+                  'ID': self._id(CITATION, text),
                   'FOLDED': "false",
                   #   'LINK': "",
                   'MODIFIED': str(now),
@@ -243,12 +679,15 @@ class FreeMapBuilder():
         return text
 
     def sectionHeading(self, element, **kwargs):
-        now = java_date(datetime.datetime.now(tz=datetime.timezone.utc))
+        now = self._now(**kwargs)
         text = ' '.join((str(self.section_counter), self._formatText(element)))
         self.section_counter += 1
+        self.section = text
+        if self.deduper is not None:
+            self.deduper.reset()
         attrib = {'COLOR': "#0033ff",
                   'CREATED': str(now),
-                  'ID': ID(),
+                  'ID': self._id(SECTION, text),
                   'FOLDED': "true",
                   #   'LINK': "",
                   'MODIFIED': str(now),
@@ -264,11 +703,11 @@ class FreeMapBuilder():
         return text
 
     def noteHeading(self, element, **kwargs):
-        now = java_date(datetime.datetime.now(tz=datetime.timezone.utc))
+        now = self._now(**kwargs)
         text = self._formatText(element)
         attrib = {'COLOR': "#990000",
                   'CREATED': str(now),
-                  'ID': ID(),
+                  'ID': self._id(HEADING, text),
                   'FOLDED': "true",
                   #   'LINK': "",
                   'MODIFIED': str(now),
@@ -277,17 +716,21 @@ class FreeMapBuilder():
                   '_node_type': HEADING,
                   '_node_level': '4',
                   '_section_counter': f'{self.section_counter}'}
+        attrib.update(note_position(text))
         self.node = ET.Element('node', attrib=attrib)
         ET.SubElement(self.node, 'font', attrib={
             'BOLD': "true", 'NAME': "SansSerif", 'SIZE': "10"})
         return text
 
     def noteText(self, element, **kwargs):
-        now = java_date(datetime.datetime.now(tz=datetime.timezone.utc))
+        now = self._now(**kwargs)
         text = self._formatText(element)
+        if self.node is not None and self._collapse(text):
+            self.node = None
+            return text
         attrib = {'COLOR': "#000000",
                   'CREATED': str(now),
-                  'ID': ID(),
+                  'ID': self._id(TEXT, text),
                   'FOLDED': "true",
                   #   'LINK': "",
                   'MODIFIED': str(now),
@@ -299,8 +742,22 @@ class FreeMapBuilder():
         if not self.node is None:
             node = ET.SubElement(self.chapter, 'node', attrib=attrib)
             node.insert(0, self.node)
+            if self.deduper is not None:
+                self.deduper.add(node, text, self._location())
             self.node = None
         return text
 
     def get_document(self):
         return ET.ElementTree(self.root)
+
+    @staticmethod
+    def load(document):
+        """Return the document of this builder from an internal map
+        ElementTree."""
+        return document
+
+    @staticmethod
+    def dump(document):
+        """Return the internal map ElementTree of a document of this
+        builder."""
+        return document
@@ -0,0 +1,208 @@
+"""
+- Map cache: the internal maps built from the notes files, stored on disk
+  by file content, so an unchanged file is never parsed twice.
+"""
+import hashlib
+import os
+import tempfile
+import zlib
+import xml.etree.ElementTree as ET
+
+from .mapbuilders import BUILDER_VERSION
+from .mapwriters import iter_xml
+
+DEFAULT_DIR = os.path.join(os.path.expanduser('~'), '.kindlenote', 'cache')
+# Maximum size of the cache files
+DEFAULT_SIZE = 256 * 2**20
+EXTENSION = '.mmz'
+# Bytes read at once when hashing a file
+BLOCK_SIZE = 2**20
+# Bytes of text compressed at once by an Entry, and of XML decompressed
+# at once by blocks
+CHUNK_SIZE = 64 * 1024
+
+
+class MapCache():
+    """Least recently used cache of internal maps.
+
+    An entry is keyed by the hash of the file content, of the builder
+    version and of the builder options and holds the map as compressed
+    XML, fast to load with expat.
+    The least recently used entries are deleted when the cache files
+    exceed max_size bytes.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_size=DEFAULT_SIZE, **kwargs):
+        super().__init__()
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, file, options=''):
+        """Return the cache key of a file built with the given builder
+        options text."""
+        digest = hashlib.sha256(
+            f'{BUILDER_VERSION}\n{options}\n'.encode('utf-8'))
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + EXTENSION)
+
+    def get(self, key):
+        """Return the cached ElementTree, None on a miss."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Most recently used
+            os.utime(path)
+        except OSError:
+            return None
+        try:
+            return ET.ElementTree(ET.fromstring(zlib.decompress(data)))
+        except (zlib.error, ET.ParseError):
+            self.remove(key)
+        return None
+
+    def blocks(self, key):
+        """Yield the cached map as blocks of XML bytes, read and
+        decompressed while consumed; nothing on a miss. Raise zlib.error
+        on a damaged entry."""
+        path = self.path(key)
+        try:
+            f = open(path, 'rb')
+            # Most recently used
+            os.utime(path)
+        except OSError:
+            return
+        with f:
+            decompressor = zlib.decompressobj()
+            for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                # Blocks of no more than CHUNK_SIZE bytes, the compression
+                # ratio of a map is high
+                while block:
+                    yield decompressor.decompress(block, CHUNK_SIZE)
+                    block = decompressor.unconsumed_tail
+            yield decompressor.flush()
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, key, document):
+        """Store an internal map, an ElementTree or a MapModel, and evict
+        the least recently used entries."""
+        os.makedirs(self.directory, exist_ok=True)
+        data = zlib.compress(''.join(iter_xml(document.getroot())).encode(
+            'utf-8', 'xmlcharrefreplace'))
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self.path(key))
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+
+    def entry(self, key):
+        """Return an Entry storing the map written to it as text."""
+        return Entry(self, key)
+
+    def remove(self, key):
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def entries(self):
+        """Return the (mtime, size, path) of the entries, oldest first."""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if name.endswith(EXTENSION):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Delete the least recently used entries beyond the maximum size."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Delete all the entries, return their number."""
+        entries = self.entries()
+        for _, _, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return len(entries)
+
+
+class Entry():
+    """A cache entry written as the XML text of a map while the map is
+    made, so the map is cached without being held in memory: the text is
+    compressed to a temporary file, stored by commit or dropped by abort.
+    """
+
+    def __init__(self, cache, key, **kwargs):
+        super().__init__()
+        self.cache = cache
+        self.key = key
+        os.makedirs(cache.directory, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=cache.directory, suffix='.tmp')
+        self.file = os.fdopen(fd, 'wb')
+        self.compressor = zlib.compressobj()
+        self.chunks = []
+        self.size = 0
+
+    def write(self, text):
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.size >= CHUNK_SIZE:
+            self._compress()
+
+    def _compress(self):
+        data = ''.join(self.chunks).encode('utf-8', 'xmlcharrefreplace')
+        self.file.write(self.compressor.compress(data))
+        self.chunks = []
+        self.size = 0
+
+    def commit(self):
+        """Store the entry and evict the least recently used ones."""
+        try:
+            self._compress()
+            self.file.write(self.compressor.flush())
+            self.file.close()
+            os.replace(self.tmp, self.cache.path(self.key))
+        except OSError:
+            self.abort()
+            raise
+        self.cache.evict()
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
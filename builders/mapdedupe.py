@@ -0,0 +1,116 @@
+"""
+- Map dedupe: find the notes of a section repeating another one, as the
+  same passage highlighted twice or a highlight within a longer one, by
+  the word shingles they share, without comparing all the pairs. Short
+  notes repeat another one only when highlighted at a nearby location.
+"""
+import re
+from collections import Counter
+
+WORD = re.compile(r'\w+')
+# Words of a shingle
+SHINGLE_SIZE = 3
+# Shingles of a note found in another note to be a repetition of it
+THRESHOLD = 0.9
+# Shingles in more notes are too common to find a repetition
+MAX_POSTINGS = 64
+# Locations between a short note and the note it repeats, at most: the
+# highlights of the same passage start at the same or nearby locations
+NEAR_LOCATIONS = 5
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Return the hashes of the word shingles of text, lowercase and
+    without punctuation. A text shorter than a shingle is one shingle."""
+    words = WORD.findall(text.lower())
+    if len(words) <= size:
+        return {hash(' '.join(words))} if words else set()
+    return {hash(' '.join(words[i:i + size]))
+            for i in range(len(words) - size + 1)}
+
+
+class Deduper():
+    """Index of the notes of a section by their shingles.
+
+    A text matches a note when at least threshold of the shingles of
+    either one are found in the other: the text repeats the note or the
+    note is within the text. The candidates are the notes sharing a
+    shingle of the text, the shingles common to more than max_postings
+    notes are ignored, so a match costs as the text, not as the section.
+    A text or note of a single shingle, as "ok", says too little to be a
+    repetition by its words alone: it matches only when both locations
+    are known and at most near locations apart.
+    """
+
+    def __init__(self, threshold=THRESHOLD, size=SHINGLE_SIZE,
+                 max_postings=MAX_POSTINGS, near=NEAR_LOCATIONS, **kwargs):
+        super().__init__()
+        self.threshold = threshold
+        self.size = size
+        self.max_postings = max_postings
+        self.near = near
+        self.reset()
+
+    def reset(self):
+        """Forget the indexed notes, at a new section."""
+        # Shingle -> notes
+        self.index = {}
+        # Note -> number of shingles
+        self.notes = {}
+        # Note -> location, the first one known
+        self.locations = {}
+        self.last = (None, set())
+
+    def add(self, note, text, location=None):
+        """Index the shingles of text as the ones of note, in addition to
+        the ones already indexed, and the note location when known."""
+        if location is not None:
+            self.locations.setdefault(note, location)
+        index = self.index
+        known = note in self.notes
+        added = 0
+        for shingle in self.shingles(text):
+            notes = index.get(shingle)
+            if notes is None:
+                index[shingle] = [note]
+            elif not known or note not in notes:
+                notes.append(note)
+            else:
+                continue
+            added += 1
+        self.notes[note] = self.notes.get(note, 0) + added
+
+    def shingles(self, text):
+        """Return the shingles of text, the ones of the last text are
+        kept, as a text is matched and then added."""
+        if text != self.last[0]:
+            self.last = (text, shingles(text, self.size))
+        return self.last[1]
+
+    def is_near(self, note, location):
+        """Return True when location and the one of note are known and
+        near."""
+        other = self.locations.get(note)
+        return location is not None and other is not None and \
+            abs(location - other) <= self.near
+
+    def match(self, text, location=None):
+        """Return the indexed note best matching text, at location when
+        known, None if none."""
+        found = self.shingles(text)
+        shared = Counter()
+        for shingle in found:
+            notes = self.index.get(shingle)
+            if notes and len(notes) <= self.max_postings:
+                shared.update(notes)
+        need = self.threshold * len(found)
+        best = None
+        best_count = 0
+        for note, count in shared.items():
+            if count > best_count and (
+                    count >= need or
+                    count >= self.threshold * self.notes[note]) and (
+                    (len(found) > 1 and self.notes[note] > 1) or
+                    self.is_near(note, location)):
+                best, best_count = note, count
+        return best
@@ -0,0 +1,340 @@
+"""
+- Map exporters: write an internal map to FreeMind, html, Markdown, JSON
+  and CSV files. The exporters of the formats share a single walk of the
+  map, each one writing its file through its own buffer.
+"""
+import csv
+import html
+import json
+
+from .mapbuilders import (CHUNK_SIZE,
+                          TITLE, AUTHORS, CITATION, SECTION, HEADING, TEXT)
+from .mapwriters import iter_events, xml_start, xml_end
+
+
+class Exporter():
+    """Base exporter, writing a file while the map is walked by export.
+
+    The walk calls start and end for each element not skipped, in
+    document order, with the element children left after skipping.
+    """
+    EXTENSION = ''
+    NEWLINE = '\n'
+
+    def __init__(self, file, **kwargs):
+        super().__init__()
+        self.file = file
+        self.kwargs = kwargs
+        self.out = None
+
+    def begin(self, document):
+        self.out = open(self.file, 'w', encoding='utf-8',
+                        errors='xmlcharrefreplace', newline=self.NEWLINE,
+                        buffering=CHUNK_SIZE)
+
+    def start(self, element, children):
+        pass
+
+    def end(self, element, children):
+        pass
+
+    def finish(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+
+
+class NotesExporter(Exporter):
+    """Exporter of the Kindle notes of a map: the book, section, note and
+    page heading nodes, in document order. Subclasses write the book
+    title, authors, citation, section and note with their methods."""
+
+    def begin(self, document):
+        super().begin(document)
+        self.book = ''
+        self.section = ''
+
+    def start(self, element, children):
+        node_type = element.get('_node_type')
+        if node_type is None or element.tag != 'node':
+            return
+        text = element.get('TEXT', '')
+        if node_type == TITLE:
+            self.book = text
+            self.title(text)
+        elif node_type == AUTHORS:
+            self.authors(text)
+        elif node_type == CITATION:
+            self.citation(text)
+        elif node_type == SECTION:
+            self.section = text
+            self.start_section(text, element)
+        elif node_type == TEXT:
+            self.write_note(text, [e.get('TEXT', '') for e in children
+                                   if e.tag == 'node' and
+                                   e.get('_node_type') == HEADING])
+
+    def end(self, element, children):
+        node_type = element.get('_node_type')
+        if node_type == SECTION:
+            self.end_section()
+        elif node_type == TITLE:
+            self.end_book()
+
+    def title(self, text):
+        pass
+
+    def authors(self, text):
+        pass
+
+    def citation(self, text):
+        pass
+
+    def start_section(self, text, element):
+        pass
+
+    def end_section(self):
+        pass
+
+    def write_note(self, text, headings):
+        pass
+
+    def end_book(self):
+        pass
+
+
+class FreeMindExporter(Exporter):
+    """FreeMind map, the same text of write_document."""
+    EXTENSION = '.mm'
+
+    def start(self, element, children):
+        self.out.write(xml_start(element, children))
+
+    def end(self, element, children):
+        self.out.write(xml_end(element, children))
+
+
+class HtmlExporter(Exporter):
+    """
+    Html page: a collapsible outline of the sections, their notes and the
+    notes page headings, written in chunks from precompiled templates.
+    """
+    EXTENSION = '.html'
+    HEAD = (
+        '<!DOCTYPE html>\n<html>\n<head>\n<meta charset="UTF-8">\n'
+        '<title>{}</title>\n<style>\n'
+        'body {{ font-family: Arial, Helvetica, sans-serif; '
+        'padding: 0px 32px; }}\n'
+        '.bookTitle {{ color: #333333; }}\n'
+        '.authors, .citation {{ color: #0033ff; }}\n'
+        '.section > summary {{ color: #0033ff; font-size: 20px; '
+        'font-weight: 700; margin-top: 16px; cursor: pointer; }}\n'
+        '.note {{ margin: 12px 0px 0px 24px; }}\n'
+        '.noteText {{ color: #000000; margin: 0px; }}\n'
+        '.noteHeading {{ color: #990000; font-size: 12px; '
+        'font-weight: 700; margin: 2px 0px 0px; }}\n'
+        '</style>\n</head>\n<body>\n').format
+    TAIL = '</body>\n</html>\n'
+    TITLE = '<h1 class="bookTitle">{}</h1>\n'.format
+    AUTHORS = '<div class="authors">{}</div>\n'.format
+    CITATION = '<div class="citation">{}</div>\n'.format
+    SECTION = '<details class="section"><summary>{}</summary>\n'.format
+    SECTION_END = '</details>\n'
+    NOTE = '<div class="note"><p class="noteText">{}</p>{}</div>\n'.format
+    HEADING = '<p class="noteHeading">{}</p>'.format
+    NODE = '<details class="node"><summary>{}</summary>\n'.format
+    NODE_END = '</details>\n'
+    LEAF = '<div class="node">{}</div>\n'.format
+
+    def begin(self, document):
+        super().begin(document)
+        title = next((e.get('TEXT', '') for e in document.iter('node')), '')
+        self.out.write(self.HEAD(html.escape(title)))
+        # The element whose subtree is left out of the page, written by it
+        self.muted = None
+
+    def start(self, element, children):
+        if self.muted is not None or element.tag != 'node':
+            return
+        node_type = element.get('_node_type')
+        text = html.escape(element.get('TEXT', ''))
+        if node_type == TITLE:
+            self.out.write(self.TITLE(text))
+        elif node_type == AUTHORS:
+            self.out.write(self.AUTHORS(text))
+            self.muted = element
+        elif node_type == CITATION:
+            self.out.write(self.CITATION(text))
+            self.muted = element
+        elif node_type == SECTION:
+            self.out.write(self.SECTION(text))
+        elif node_type == TEXT:
+            self.out.write(self.NOTE(text, ''.join(
+                self.HEADING(html.escape(e.get('TEXT', '')))
+                for e in children
+                if e.tag == 'node' and e.get('_node_type') == HEADING)))
+            self.muted = element
+        elif any(e.tag == 'node' for e in children):
+            self.out.write(self.NODE(text))
+        else:
+            self.out.write(self.LEAF(text))
+
+    def end(self, element, children):
+        if self.muted is not None:
+            if element is self.muted:
+                self.muted = None
+            return
+        if element.tag != 'node':
+            return
+        node_type = element.get('_node_type')
+        if node_type == SECTION:
+            self.out.write(self.SECTION_END)
+        elif node_type != TITLE and any(e.tag == 'node' for e in children):
+            self.out.write(self.NODE_END)
+
+    def finish(self):
+        if self.out is not None:
+            self.out.write(self.TAIL)
+        super().finish()
+
+
+class MarkdownExporter(NotesExporter):
+    """Markdown page: the book title and sections as headers, the notes
+    as list items followed by their page headings."""
+    EXTENSION = '.md'
+
+    def title(self, text):
+        self.out.write(f'# {text}\n\n')
+
+    def authors(self, text):
+        self.out.write(f'*{text}*\n\n')
+
+    def citation(self, text):
+        self.out.write(f'> {text}\n\n')
+
+    def start_section(self, text, element):
+        self.out.write(f'## {text}\n\n')
+
+    def end_section(self):
+        self.out.write('\n')
+
+    def write_note(self, text, headings):
+        self.out.write('- ' + ' '.join(text.split()) + '\n')
+        for heading in headings:
+            self.out.write(f'  <small>{heading}</small>\n')
+
+
+class JsonExporter(NotesExporter):
+    """JSON list of the books, each one with its title, authors, citation
+    and sections, each section with its title, counter and notes, each
+    note with its text and page headings. A book is written as soon as
+    it is complete."""
+    EXTENSION = '.json'
+
+    def begin(self, document):
+        super().begin(document)
+        self.out.write('[')
+        self.books = 0
+        self.current = None
+        self.sections = None
+
+    def title(self, text):
+        self.current = {'title': text, 'authors': '', 'citation': '',
+                        'sections': []}
+
+    def authors(self, text):
+        if self.current is not None:
+            self.current['authors'] = text
+
+    def citation(self, text):
+        if self.current is not None:
+            self.current['citation'] = text
+
+    def start_section(self, text, element):
+        if self.current is not None:
+            self.sections = {'title': text,
+                             'counter': int(element.get('_section_counter', 0)),
+                             'notes': []}
+            self.current['sections'].append(self.sections)
+
+    def write_note(self, text, headings):
+        if self.sections is not None:
+            self.sections['notes'].append({'text': text,
+                                           'headings': headings})
+
+    def end_section(self):
+        self.sections = None
+
+    def end_book(self):
+        if self.current is not None:
+            self.out.write(',\n' if self.books else '\n')
+            json.dump(self.current, self.out, ensure_ascii=False)
+            self.books += 1
+            self.current = None
+
+    def finish(self):
+        if self.out is not None:
+            self.out.write('\n]\n')
+        super().finish()
+
+
+class CsvExporter(NotesExporter):
+    """CSV table of the notes: book, section, page heading and text."""
+    EXTENSION = '.csv'
+    NEWLINE = ''
+    FIELDS = ('book', 'section', 'heading', 'text')
+
+    def begin(self, document):
+        super().begin(document)
+        self.writer = csv.writer(self.out)
+        self.writer.writerow(self.FIELDS)
+
+    def write_note(self, text, headings):
+        self.writer.writerow((self.book, self.section, ' '.join(headings),
+                              text))
+
+
+# Exporters by format name
+EXPORTERS = {}
+
+
+def register(name, exporter):
+    """Make an Exporter subclass available as the format name."""
+    EXPORTERS[name] = exporter
+
+
+register('mm', FreeMindExporter)
+register('html', HtmlExporter)
+register('md', MarkdownExporter)
+register('json', JsonExporter)
+register('csv', CsvExporter)
+
+
+def exporter(name, file, **kwargs):
+    """Return the exporter of the format name writing to file."""
+    if name not in EXPORTERS:
+        raise ValueError(f'Unknown export format: {name}')
+    return EXPORTERS[name](file, **kwargs)
+
+
+def export(document, exporters, skip=None):
+    """Write an internal map with the exporters in a single walk, leaving
+    out the elements for which skip(element) is true, as a MapFilter,
+    together with their subtree. Return the number of written nodes."""
+    nodes = 0
+    for e in exporters:
+        e.begin(document)
+    try:
+        for start, element, children in iter_events(document.getroot(),
+                                                    skip):
+            if start and element.tag == 'node':
+                nodes += 1
+            for e in exporters:
+                if start:
+                    e.start(element, children)
+                else:
+                    e.end(element, children)
+    finally:
+        for e in exporters:
+            e.finish()
+    return nodes
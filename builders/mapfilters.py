@@ -0,0 +1,100 @@
+"""
+- Map filters: predicates of the internal map elements left out of an
+  export, evaluated while the map is written, so no filtered tree is built.
+"""
+from .mapbuilders import SECTION, HEADING, TEXT
+from .mappositions import PAGE, LOCATION, note_value
+
+
+def to_int(value):
+    """Return value as an integer, None when it is empty or not a number."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class MapFilter():
+    """Skip predicate built from the export options:
+
+        - section_range: (low, high) section counters to include
+        - level_low: deepest node level to include
+        - pages: include the page headings
+        - summary: include the sections only, without the notes
+        - page_range: (low, high) pages of the notes to include
+        - location_range: (low, high) locations of the notes to include
+
+    Calling the filter on an element returns True when the element and
+    its subtree must be left out. Elements without a node type, as the
+    nodes of a FreeMind map not built from Kindle notes, are kept. With a
+    page or location range, the notes without a page or location are
+    left out: once prepared with a map keeping the position indexes of
+    its notes, a MapModel, the notes in the ranges are looked up in them,
+    else each note heading is read.
+    """
+
+    def __init__(self, section_range=None, level_low=None, pages=True,
+                 summary=False, page_range=None, location_range=None,
+                 **kwargs):
+        super().__init__()
+        low, high = section_range or (None, None)
+        self.low = to_int(low)
+        self.high = to_int(high)
+        # (attribute, low, high) of the note position ranges
+        self.positions = []
+        for attribute, position_range in ((PAGE, page_range),
+                                          (LOCATION, location_range)):
+            low, high = position_range or (None, None)
+            if to_int(low) is not None or to_int(high) is not None:
+                self.positions.append((attribute, to_int(low), to_int(high)))
+        self.level = to_int(level_low)
+        self.pages = pages
+        self.summary = summary
+        # The notes in the position ranges, once prepared
+        self.kept = None
+
+    @classmethod
+    def from_options(cls, options):
+        """Return a filter from the options of the notes manager."""
+        return cls(**options)
+
+    def prepare(self, document):
+        """Find the notes of an internal map in the page and location
+        ranges with the PositionIndex the map keeps, and return the filter.
+        The notes of a map keeping no index are scanned: indexing them
+        would walk the map, more than the scan of their headings costs."""
+        self.kept = None
+        indexes = getattr(document, 'indexes', None)
+        if indexes is None:
+            return self
+        for attribute, low, high in self.positions:
+            notes = set(indexes[attribute].between(low, high))
+            self.kept = notes if self.kept is None else self.kept & notes
+        return self
+
+    def __call__(self, element):
+        node_type = element.get('_node_type')
+        if node_type is None:
+            return False
+        if not self.pages and node_type == HEADING:
+            return True
+        if self.summary and node_type in (TEXT, HEADING):
+            return True
+        if self.level is not None and \
+                (to_int(element.get('_node_level')) or 0) > self.level:
+            return True
+        if node_type == SECTION:
+            counter = to_int(element.get('_section_counter')) or 0
+            if self.low is not None and counter < self.low:
+                return True
+            if self.high is not None and counter > self.high:
+                return True
+        if node_type == TEXT and self.kept is not None:
+            return element not in self.kept
+        if node_type == TEXT:
+            for attribute, low, high in self.positions:
+                value = note_value(element, attribute)
+                if value is None or (low is not None and value < low) or \
+                        (high is not None and value > high):
+                    return True
+        return False
@@ -0,0 +1,128 @@
+"""
+- Map library: a single FreeMind map of many Kindle notes files, a branch
+  per book under a library center node. The books are parsed over a
+  process pool and written to the map one by one, as soon as parsed, so
+  only a bounded window of books is held in memory.
+"""
+import datetime
+import os
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+from .mapbuilders import NotesParser, IDGenerator, HASH_IDS, java_date
+from .mapcache import MapCache
+from .mapmerge import center, unique_ids
+from .mapwriters import iter_xml, start_tag
+
+# Node type of the library center
+LIBRARY = 'library'
+
+
+def parse_book(file, ids=HASH_IDS, cache=None, dedupe=False):
+    """Worker process: parse a notes file and return its summary
+    dictionary: file, ok, nodes, seconds, logs and the book, the XML text
+    of the book title node."""
+    start = time.perf_counter()
+    summary = {'file': file, 'ok': False, 'nodes': 0, 'seconds': 0.0,
+               'logs': [], 'book': None}
+    try:
+        parser = NotesParser(stream=True, ids=ids, dedupe=dedupe,
+                             cache=MapCache(cache) if cache else None)
+        document = parser.parse(file)
+        summary['logs'] = parser.getlogs()
+        if document is not None:
+            summary['book'] = ET.tostring(center(document), encoding='utf-8')
+            summary['ok'] = True
+    except Exception as e:
+        summary['logs'].append(f'{e}')
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+
+def iter_books(files, workers=None, window=None, **kwargs):
+    """Yield the parse_book summaries of the files, in the files order,
+    parsed over a pool of worker processes, None for one per CPU. No more
+    than window files, twice the workers by default, are parsed ahead of
+    the one being yielded."""
+    if workers == 1:
+        for file in files:
+            yield parse_book(file, **kwargs)
+        return
+    window = window or 2 * (workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        files = iter(files)
+        while True:
+            while len(pending) < window:
+                file = next(files, None)
+                if file is None:
+                    break
+                pending.append(
+                    (file, executor.submit(parse_book, file, **kwargs)))
+            if not pending:
+                break
+            file, future = pending.pop(0)
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {'file': file, 'ok': False, 'nodes': 0, 'seconds': 0.0,
+                       'logs': [f'{e}'], 'book': None}
+
+
+def library_node(title, id, now=None):
+    """Return the library center node element, created now, a datetime,
+    or the current time."""
+    now = str(java_date(now or datetime.datetime.now(
+        tz=datetime.timezone.utc)))
+    element = ET.Element('node', attrib={'COLOR': "#000000",
+                                         'CREATED': now,
+                                         'ID': id,
+                                         'MODIFIED': now,
+                                         'TEXT': title,
+                                         '_node_type': LIBRARY,
+                                         '_node_level': '0',
+                                         '_section_counter': '0'})
+    ET.SubElement(element, 'font', attrib={
+        'BOLD': "true", 'NAME': "SansSerif", 'SIZE': "16"})
+    return element
+
+
+def write_library(files, mm, title='Library', workers=None, window=None,
+                  skip=None, now=None, **kwargs):
+    """Write the notes of the files to the FreeMind file mm, a book branch
+    per file, leaving out the elements for which skip(element) is true.
+    The keywords are the parse_book ones. The node IDs are unique across
+    the library: a node colliding with a node of a previous book gets a
+    new ID. The file mm is replaced only when the map is complete.
+    Return the summaries of the files, with the number of written nodes
+    and without the book."""
+    ids = IDGenerator(kwargs.get('ids') or HASH_IDS)
+    root = library_node(title, ids(LIBRARY, title), now)
+    ids.reserve([root.get('ID')])
+    summaries = []
+    tmp = mm + '.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8', errors='xmlcharrefreplace',
+                  newline='\n') as f:
+            f.write('<map version="1.0.1">')
+            f.write(start_tag(root) + '>')
+            f.writelines(iter_xml(root[0]))
+            for summary in iter_books(files, workers, window, **kwargs):
+                book = summary.pop('book')
+                if book is not None:
+                    book = ET.fromstring(book)
+                    book.set('POSITION', 'right')
+                    unique_ids(book, ids)
+                    if skip is None or not skip(book):
+                        for text in iter_xml(book, skip):
+                            if text.startswith('<node'):
+                                summary['nodes'] += 1
+                            f.write(text)
+                summaries.append(summary)
+            f.write('</node></map>')
+        os.replace(tmp, mm)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return summaries
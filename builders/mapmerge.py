@@ -0,0 +1,144 @@
+"""
+- Map merge: append to an existing FreeMind map the new notes of a Kindle
+  notes export, leaving the existing nodes and their IDs untouched.
+"""
+import hashlib
+import re
+import xml.etree.ElementTree as ET
+from copy import deepcopy
+
+from .mapbuilders import (NotesParser, IDGenerator,
+                          TITLE, SECTION, HEADING, TEXT)
+from .mapwriters import write_document
+
+# The section counter the builder prepends to the section title
+COUNTER = re.compile(r'^\d+ ')
+
+
+def section_title(element):
+    """Return the title of a section element without its counter."""
+    return COUNTER.sub('', element.get('TEXT', ''), count=1)
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def heading_text(element):
+    """Return the text of the page heading of a note element, None when
+    the note has no heading."""
+    for e in element.iterfind('node'):
+        if e.get('_node_type') == HEADING:
+            return e.get('TEXT')
+    return None
+
+
+def center(document):
+    """Return the book title element of an internal map."""
+    for element in document.getroot().iter('node'):
+        if element.get('_node_type') == TITLE:
+            return element
+    raise ValueError('No book title found')
+
+
+def sections(element):
+    return [e for e in element.iterfind('node')
+            if e.get('_node_type') == SECTION]
+
+
+def notes(element):
+    return [e for e in element.iterfind('node')
+            if e.get('_node_type') == TEXT]
+
+
+def set_counter(element, counter):
+    """Set the section counter of a node and of its descendant nodes."""
+    for e in element.iter('node'):
+        e.set('_section_counter', str(counter))
+
+
+def unique_ids(element, ids):
+    """Give the nodes of element an ID not yet used by ids, an
+    IDGenerator, when they collide."""
+    for e in element.iter('node'):
+        if e.get('ID') in ids:
+            e.set('ID', ids())
+        ids.reserve([e.get('ID')])
+
+
+def merge_maps(existing, new, skip=None):
+    """Append to the existing internal map the notes of the new one it
+    lacks, in place, and return the number of added sections and notes.
+
+    A note is matched by its section title, page heading and text hash; a
+    note without page heading, on either side, matches on the section
+    title and the text hash. The new notes for which skip(element) is
+    true, as a MapFilter, are left out. The new map is left untouched.
+    The added nodes get new IDs when they collide with the existing ones.
+    """
+    existing_center = center(existing)
+    ids = IDGenerator()
+    ids.reserve(e.get('ID') for e in existing.iter('node'))
+    existing_sections = {}
+    # (section title, text hash) -> page headings of the existing notes
+    index = {}
+    counter = 0
+    for section in sections(existing_center):
+        title = section_title(section)
+        existing_sections.setdefault(title, section)
+        counter = max(counter, int(section.get('_section_counter', 0)))
+        for note in notes(section):
+            key = (title, text_hash(note.get('TEXT', '')))
+            index.setdefault(key, set()).add(heading_text(note))
+
+    added_sections = added_notes = 0
+    for new_section in sections(center(new)):
+        if skip is not None and skip(new_section):
+            continue
+        title = section_title(new_section)
+        section = existing_sections.get(title)
+        for note in notes(new_section):
+            if skip is not None and skip(note):
+                continue
+            key = (title, text_hash(note.get('TEXT', '')))
+            heading = heading_text(note)
+            headings = index.get(key, ())
+            if headings and (heading is None or heading in headings or
+                             None in headings):
+                continue
+            if section is None:
+                # New section, numbered after the existing ones
+                counter += 1
+                # A new element: a copy shares the attributes of the
+                # new section
+                section = ET.Element(new_section.tag,
+                                     dict(new_section.attrib))
+                section.text = new_section.text
+                section.tail = new_section.tail
+                section.extend(deepcopy(e) for e in new_section
+                               if e.tag != 'node')
+                section.set('TEXT', f'{counter - 1} {title}')
+                set_counter(section, counter)
+                unique_ids(section, ids)
+                existing_center.append(section)
+                existing_sections[title] = section
+                added_sections += 1
+            note = deepcopy(note)
+            if skip is not None:
+                note[:] = [e for e in note if not skip(e)]
+            set_counter(note, section.get('_section_counter'))
+            unique_ids(note, ids)
+            section.append(note)
+            index.setdefault(key, set()).add(heading)
+            added_notes += 1
+    return added_sections, added_notes
+
+
+def merge_document(document, file, skip=None):
+    """Merge the new notes of an internal map into the FreeMind map file
+    and write it back. Return the number of added sections and notes."""
+    existing = NotesParser().parse_xml(file)
+    added = merge_maps(existing, document, skip=skip)
+    if any(added):
+        write_document(existing, file)
+    return added
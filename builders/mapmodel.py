@@ -0,0 +1,472 @@
+"""
+- Map model: compact records of the Kindle notes, a Book of Sections of
+  Notes with their PageHeading. The records hold native integers and
+  share their FreeMind style by type. They answer the element interface
+  read by the map writers, exporters, filters and explore, so a MapModel
+  is exported as an ElementTree is, without building its elements.
+"""
+import xml.etree.ElementTree as ET
+
+from .mapbuilders import (FreeMapBuilder, ID,
+                          TITLE, AUTHORS, CITATION, SECTION, HEADING, TEXT)
+from .mappositions import (PositionIndex, index_notes, note_position,
+                           COLOR, PAGE, LOCATION)
+
+
+class Element():
+    """The read only element interface of the records: tag, text, tail,
+    get, items, iteration over the children, iter and iterfind."""
+    __slots__ = ()
+    tag = None
+    text = None
+    tail = None
+
+    def children(self):
+        return ()
+
+    def __iter__(self):
+        return iter(self.children())
+
+    def __reversed__(self):
+        return reversed(self.children())
+
+    def __len__(self):
+        return len(self.children())
+
+    def items(self):
+        return []
+
+    def get(self, key, default=None):
+        for k, v in self.items():
+            if k == key:
+                return v
+        return default
+
+    @property
+    def attrib(self):
+        return dict(self.items())
+
+    def iter(self, tag=None):
+        """Yield the element and its subtree in document order, only the
+        elements of tag when given."""
+        stack = [self]
+        while stack:
+            element = stack.pop()
+            if tag is None or element.tag == tag:
+                yield element
+            stack.extend(reversed(element.children()))
+
+    def iterfind(self, tag):
+        """Yield the children of tag."""
+        return (e for e in self.children() if e.tag == tag)
+
+
+class Font(Element):
+    """A node font, one shared by all the records of a type."""
+    __slots__ = ('size',)
+    tag = 'font'
+
+    def __init__(self, size):
+        self.size = size
+
+    def items(self):
+        return [('BOLD', 'true'), ('NAME', 'SansSerif'), ('SIZE', self.size)]
+
+
+class Record(Element):
+    """A map node: the node style is shared by the records of a type. The
+    node TEXT attribute is the content slot, the element text is None."""
+    __slots__ = ('id', 'content', 'created', 'modified', 'section_counter')
+    tag = 'node'
+    TYPE = None
+    LEVEL = 0
+    COLOR = '#000000'
+    FOLDED = None
+    POSITION = None
+    FONT = None
+
+    def __init__(self, content, section_counter=0, id=None, created=0,
+                 modified=None):
+        self.id = id or ID()
+        self.content = content
+        self.created = created
+        self.modified = created if modified is None else modified
+        self.section_counter = section_counter
+
+    def get(self, key, default=None):
+        """Return an internal map attribute, as an element does: the
+        node level, section counter and timestamps are integers."""
+        if key == '_node_type':
+            return self.TYPE
+        if key == 'TEXT':
+            return self.content
+        if key == '_node_level':
+            return self.LEVEL
+        if key == '_section_counter':
+            return self.section_counter
+        if key == 'ID':
+            return self.id
+        if key == 'CREATED':
+            return self.created
+        if key == 'MODIFIED':
+            return self.modified
+        return super().get(key, default)
+
+    def set(self, key, value):
+        """Set the TEXT of the node, as the dedupe of the builder does."""
+        if key != 'TEXT':
+            raise KeyError(key)
+        self.content = value
+
+    def children(self):
+        return (self.FONT,) if self.FONT is not None else ()
+
+    def items(self):
+        """Return the FreeMind attributes of the node, in the order
+        FreeMapBuilder sets them."""
+        items = [('COLOR', self.COLOR),
+                 ('CREATED', str(self.created)),
+                 ('ID', self.id)]
+        if self.FOLDED is not None:
+            items.append(('FOLDED', self.FOLDED))
+        items.append(('MODIFIED', str(self.modified)))
+        if self.POSITION is not None:
+            items.append(('POSITION', self.POSITION))
+        items.append(('TEXT', self.content))
+        items.append(('_node_type', self.TYPE))
+        items.append(('_node_level', str(self.LEVEL)))
+        items.append(('_section_counter', str(self.section_counter)))
+        return items
+
+    def to_element(self, parent, skip=None):
+        """Append the FreeMind element of the node and of its children to
+        parent, leaving out the records for which skip(record) is true."""
+        element = ET.SubElement(parent, 'node', attrib=dict(self.items()))
+        for child in self.children():
+            if isinstance(child, Font):
+                ET.SubElement(element, 'font', attrib=dict(child.items()))
+            elif skip is None or not skip(child):
+                child.to_element(element, skip)
+        return element
+
+    @classmethod
+    def from_element(cls, element):
+        attrib = element.attrib
+        return cls(attrib.get('TEXT', ''),
+                   section_counter=int(attrib.get('_section_counter', 0)),
+                   id=attrib.get('ID'),
+                   created=int(attrib.get('CREATED', 0)),
+                   modified=int(attrib.get('MODIFIED', 0)))
+
+
+class PageHeading(Record):
+    """A page heading, with the highlight colour, page and location
+    parsed from its text, see note_position."""
+    __slots__ = ('color', 'page', 'location')
+    TYPE = HEADING
+    LEVEL = 4
+    COLOR = '#990000'
+    FOLDED = 'true'
+    POSITION = 'right'
+    FONT = Font('10')
+
+    def __init__(self, content, color=None, page=None, location=None,
+                 **kwargs):
+        super().__init__(content, **kwargs)
+        self.color = color
+        self.page = page
+        self.location = location
+
+    def get(self, key, default=None):
+        if key == LOCATION:
+            return default if self.location is None else self.location
+        if key == PAGE:
+            return default if self.page is None else self.page
+        if key == COLOR:
+            return default if self.color is None else self.color
+        return super().get(key, default)
+
+    def items(self):
+        items = super().items()
+        if self.color is not None:
+            items.append((COLOR, self.color))
+        if self.page is not None:
+            items.append((PAGE, str(self.page)))
+        if self.location is not None:
+            items.append((LOCATION, str(self.location)))
+        return items
+
+    @classmethod
+    def from_element(cls, element):
+        heading = super().from_element(element)
+        heading.color = element.get(COLOR)
+        page = element.get(PAGE)
+        heading.page = None if page is None else int(page)
+        location = element.get(LOCATION)
+        heading.location = None if location is None else int(location)
+        return heading
+
+
+class Note(Record):
+    __slots__ = ('heading',)
+    TYPE = TEXT
+    LEVEL = 3
+    FOLDED = 'true'
+    POSITION = 'right'
+
+    def __init__(self, content, heading=None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.heading = heading
+
+    def children(self):
+        return (self.heading,) if self.heading is not None else ()
+
+
+class Section(Record):
+    __slots__ = ('notes',)
+    TYPE = SECTION
+    LEVEL = 2
+    COLOR = '#0033ff'
+    FOLDED = 'true'
+    POSITION = 'right'
+    FONT = Font('12')
+
+    def __init__(self, content, **kwargs):
+        super().__init__(content, **kwargs)
+        self.notes = []
+
+    def children(self):
+        return [self.FONT] + self.notes
+
+
+class Authors(Record):
+    __slots__ = ()
+    TYPE = AUTHORS
+    LEVEL = 2
+    COLOR = '#0033ff'
+    FOLDED = 'false'
+    POSITION = 'right'
+
+
+class Citation(Authors):
+    __slots__ = ()
+    TYPE = CITATION
+    LEVEL = 1
+
+
+class Book(Record):
+    """The book title, the center of the map: its children are the
+    authors, the citations and the sections."""
+    __slots__ = ('nodes',)
+    TYPE = TITLE
+    LEVEL = 1
+    FONT = Font('14')
+
+    def __init__(self, content, **kwargs):
+        super().__init__(content, **kwargs)
+        self.nodes = []
+
+    def children(self):
+        return [self.FONT] + self.nodes
+
+    def sections(self):
+        return [node for node in self.nodes if isinstance(node, Section)]
+
+    def notes(self):
+        """Yield the notes of all the sections."""
+        for section in self.sections():
+            yield from section.notes
+
+    def stats(self):
+        """Return the number of sections, notes and page headings and the
+        maximum section counter."""
+        sections = self.sections()
+        notes = sum(len(section.notes) for section in sections)
+        headings = sum(1 for note in self.notes() if note.heading is not None)
+        return {'sections': len(sections),
+                'notes': notes,
+                'headings': headings,
+                'max_section_counter': max(
+                    (section.section_counter for section in sections),
+                    default=0)}
+
+    @classmethod
+    def from_center(cls, center):
+        """Return the Book of the center node of an internal map, the
+        nodes of unknown type are left out."""
+        types = {AUTHORS: Authors, CITATION: Citation}
+        book = cls.from_element(center)
+        for element in center.iterfind('node'):
+            node_type = element.get('_node_type')
+            if node_type in types:
+                book.nodes.append(types[node_type].from_element(element))
+            elif node_type == SECTION:
+                section = Section.from_element(element)
+                for e in element.iterfind('node'):
+                    if e.get('_node_type') == TEXT:
+                        note = Note.from_element(e)
+                        heading = next(
+                            (h for h in e.iterfind('node')
+                             if h.get('_node_type') == HEADING), None)
+                        if heading is not None:
+                            note.heading = PageHeading.from_element(heading)
+                        section.notes.append(note)
+                book.nodes.append(section)
+        return book
+
+
+class MapRoot(Element):
+    """The map element of a MapModel, the book its only child."""
+    __slots__ = ('book',)
+    tag = 'map'
+
+    def __init__(self, book=None):
+        self.book = book
+
+    def children(self):
+        return (self.book,) if self.book is not None else ()
+
+    def items(self):
+        return [('version', '1.0.1')]
+
+
+class MapModel():
+    """An internal map of a Book, with the ElementTree methods read by the
+    map writers and exporters: getroot and iter. The notes are kept in a
+    PositionIndex by page and by location, the indexes, for the range
+    queries of MapFilter; they are built walking the book when not given.
+    """
+    POSITIONS = (PAGE, LOCATION)
+
+    def __init__(self, book=None, indexes=None, **kwargs):
+        super().__init__()
+        self.root = MapRoot(book)
+        if indexes is None:
+            indexes = {attribute: index_notes(self.iter('node'), attribute)
+                       for attribute in self.POSITIONS}
+        self.indexes = indexes
+
+    @property
+    def book(self):
+        return self.root.book
+
+    def getroot(self):
+        return self.root
+
+    def iter(self, tag=None):
+        return self.root.iter(tag)
+
+    def to_tree(self, skip=None):
+        """Return the internal map ElementTree of the book, leaving out the
+        records for which skip(record) is true, as a MapFilter."""
+        root = ET.Element('map', attrib={'version': "1.0.1"})
+        if self.book is not None and (skip is None or not skip(self.book)):
+            self.book.to_element(root, skip)
+        return ET.ElementTree(root)
+
+    @classmethod
+    def from_tree(cls, document):
+        """Return the MapModel of the first book of an internal map
+        ElementTree, see Book.from_center."""
+        center = next((e for e in document.getroot().iter('node')
+                       if e.get('_node_type') == TITLE), None)
+        if center is None:
+            raise ValueError('No book title found')
+        return cls(Book.from_center(center))
+
+
+class ModelBuilder(FreeMapBuilder):
+    """
+    Convert a HTML formatted file from Kindle Notes to a MapModel, with
+    the same interface of FreeMapBuilder.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.book = None
+
+    def XMLroot(self, element='map', **kwargs):
+        self.book = None
+        self.indexes = {attribute: PositionIndex(attribute)
+                        for attribute in MapModel.POSITIONS}
+
+    def comment(self, text, **kwargs):
+        pass
+
+    def bookTitle(self, element, **kwargs):
+        text = self._formatText(element)
+        self.title = text
+        self.book = Book(text, section_counter=self.section_counter,
+                         id=self._id(TITLE, text),
+                         created=self._now(**kwargs))
+        return text
+
+    def authors(self, element, **kwargs):
+        text = self._formatText(element)
+        self.book.nodes.append(Authors(
+            text, section_counter=self.section_counter,
+            id=self._id(AUTHORS, text), created=self._now(**kwargs)))
+        return text
+
+    def citation(self, element, **kwargs):
+        text = self._formatText(element)
+        self.book.nodes.append(Citation(
+            text, section_counter=self.section_counter,
+            id=self._id(CITATION, text), created=self._now(**kwargs)))
+        return text
+
+    def sectionHeading(self, element, **kwargs):
+        text = ' '.join((str(self.section_counter), self._formatText(element)))
+        self.section_counter += 1
+        self.section = text
+        if self.deduper is not None:
+            self.deduper.reset()
+        self.chapter = Section(text, section_counter=self.section_counter,
+                               id=self._id(SECTION, text),
+                               created=self._now(**kwargs))
+        self.book.nodes.append(self.chapter)
+        return text
+
+    def noteHeading(self, element, **kwargs):
+        text = self._formatText(element)
+        position = note_position(text)
+        page = position.get(PAGE)
+        location = position.get(LOCATION)
+        self.node = PageHeading(text, color=position.get(COLOR),
+                                page=None if page is None else int(page),
+                                location=None if location is None
+                                else int(location),
+                                section_counter=self.section_counter,
+                                id=self._id(HEADING, text),
+                                created=self._now(**kwargs))
+        return text
+
+    def noteText(self, element, **kwargs):
+        text = self._formatText(element)
+        if self.node is not None and self._collapse(text):
+            self.node = None
+        if not self.node is None:
+            note = Note(
+                text, heading=self.node, section_counter=self.section_counter,
+                id=self._id(TEXT, text), created=self._now(**kwargs))
+            self.chapter.notes.append(note)
+            for attribute, index in self.indexes.items():
+                value = self.node.get(attribute)
+                if value is not None:
+                    index.add(value, note)
+            if self.deduper is not None:
+                self.deduper.add(note, text, self._location())
+            self.node = None
+        return text
+
+    def get_document(self):
+        return MapModel(self.book, self.indexes)
+
+    @staticmethod
+    def load(document):
+        return MapModel.from_tree(document)
+
+    @staticmethod
+    def dump(document):
+        # The cache writes the map XML from the records, as the writers do
+        return document
@@ -0,0 +1,84 @@
+"""
+- Map outline: the rows of an internal map shown as an outline, the
+  children of a node are made only when the node is expanded, so a view
+  of the outline costs the visible rows, not the whole map.
+"""
+from .mapbuilders import TITLE
+
+# Characters of the node text shown in a row
+ROW_LENGTH = 200
+
+
+class Outline():
+    """Visible rows of an internal map outline.
+
+    The rows are dictionaries, as a RecycleView data: title, level,
+    expandable and expanded. At first the book title is expanded and its
+    sections are collapsed. The nodes for which skip(element) is true, as
+    a MapFilter, are left out.
+    """
+
+    def __init__(self, document, skip=None, length=ROW_LENGTH, **kwargs):
+        super().__init__()
+        self.skip = skip
+        self.length = length
+        # Expanded elements
+        self.expanded = set()
+        # Elements of the rows
+        self.elements = []
+        self.rows = []
+        top = self.children(document.getroot())
+        self.expanded.update(e for e in top if e.get('_node_type') == TITLE)
+        self._insert(0, top, 0)
+
+    def children(self, element):
+        return [e for e in element.iterfind('node')
+                if self.skip is None or not self.skip(e)]
+
+    def row(self, element, level):
+        text = element.get('TEXT', '')
+        if len(text) > self.length:
+            text = text[:self.length] + '...'
+        return {'title': text,
+                'level': level,
+                'expandable': bool(self.children(element)),
+                'expanded': element in self.expanded}
+
+    def _visible(self, elements, level):
+        """Return the (element, level) of the visible rows of elements and
+        of their expanded descendants, in document order."""
+        visible = []
+        stack = [(e, level) for e in reversed(elements)]
+        while stack:
+            element, level = stack.pop()
+            visible.append((element, level))
+            if element in self.expanded:
+                stack.extend((e, level + 1)
+                             for e in reversed(self.children(element)))
+        return visible
+
+    def _insert(self, index, elements, level):
+        visible = self._visible(elements, level)
+        self.elements[index:index] = [e for e, _ in visible]
+        self.rows[index:index] = [self.row(e, l) for e, l in visible]
+        return len(visible)
+
+    def toggle(self, index):
+        """Expand or collapse the row at index. Return (start, stop, rows):
+        the visible rows[start:stop] are replaced by rows."""
+        element = self.elements[index]
+        level = self.rows[index]['level']
+        stop = index + 1
+        while stop < len(self.rows) and self.rows[stop]['level'] > level:
+            stop += 1
+        del self.elements[index:stop]
+        del self.rows[index:stop]
+        if element in self.expanded:
+            self.expanded.discard(element)
+        elif self.children(element):
+            self.expanded.add(element)
+        count = self._insert(index, [element], level)
+        return index, stop, self.rows[index:index + count]
+
+    def __len__(self):
+        return len(self.rows)
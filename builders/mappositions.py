@@ -0,0 +1,109 @@
+"""
+- Map positions: the highlight colour, page and location of the Kindle
+  notes, parsed from their page headings, and an index of the notes of a
+  book sorted by position, for ordered and range queries.
+"""
+import re
+from bisect import bisect_left, bisect_right
+
+# Page heading attributes of the parsed position
+COLOR = '_color'
+PAGE = '_page'
+LOCATION = '_location'
+
+# Parts of a page heading, as exported in English and in Italian:
+# Highlight(yellow) - Page 12 · Location 180
+# Evidenziazione(giallo) - Pagina 10 · Posizione 66
+# Nota - Pagina 13 · Posizione 86
+COLOR_PATTERN = re.compile(r'\(\s*([^()]+?)\s*\)')
+PAGE_PATTERN = re.compile(r'\b(?:page|pagina)\s+(\d+)', re.IGNORECASE)
+LOCATION_PATTERN = re.compile(r'\b(?:location|posizione)\s+(\d+)',
+                              re.IGNORECASE)
+
+
+def note_position(text):
+    """Return the attributes of the position parsed from a page heading
+    text: COLOR, PAGE and LOCATION, the missing ones left out."""
+    position = {}
+    match = COLOR_PATTERN.search(text)
+    if match:
+        position[COLOR] = match.group(1)
+    match = PAGE_PATTERN.search(text)
+    if match:
+        position[PAGE] = match.group(1)
+    match = LOCATION_PATTERN.search(text)
+    if match:
+        position[LOCATION] = match.group(1)
+    return position
+
+
+class PositionIndex():
+    """Notes sorted by a position, a page or a location.
+
+    The notes are kept with their position in two parallel lists sorted
+    by position, the notes of the same position in the order they were
+    added: adding the notes in position order, as they are exported,
+    appends them. Range queries are bisections of the positions.
+    """
+
+    def __init__(self, attribute=LOCATION, **kwargs):
+        super().__init__()
+        self.attribute = attribute
+        self.positions = []
+        self.notes = []
+
+    def __len__(self):
+        return len(self.notes)
+
+    def __iter__(self):
+        """Yield the (position, note) pairs in position order."""
+        return zip(self.positions, self.notes)
+
+    def add(self, position, note):
+        index = bisect_right(self.positions, position)
+        self.positions.insert(index, position)
+        self.notes.insert(index, note)
+
+    def between(self, low=None, high=None):
+        """Return the notes of the positions from low to high, both
+        included, None for an open end, in position order."""
+        start = 0 if low is None else bisect_left(self.positions, low)
+        stop = len(self.positions) if high is None else \
+            bisect_right(self.positions, high)
+        return self.notes[start:stop]
+
+    def first(self, position):
+        """Return the first note at position or after it, None if none."""
+        index = bisect_left(self.positions, position)
+        return self.notes[index] if index < len(self.notes) else None
+
+
+def note_value(note, attribute=LOCATION):
+    """Return the integer attribute of the page heading of a note, None
+    when the note has no such heading."""
+    for child in note:
+        value = child.get(attribute)
+        if value is not None:
+            return int(value)
+    return None
+
+
+def index_notes(notes, attribute=LOCATION):
+    """Return the PositionIndex by attribute of the notes, the notes and
+    the other nodes without the attribute left out."""
+    index = PositionIndex(attribute)
+    for note in notes:
+        value = note_value(note, attribute)
+        if value is not None:
+            index.add(value, note)
+    return index
+
+
+def index_positions(document, attribute=LOCATION):
+    """Return the PositionIndex by attribute of the notes of an internal
+    map: the one kept by the document, as a MapModel, else one built
+    walking the map."""
+    indexes = getattr(document, 'indexes', None)
+    if indexes is not None:
+        return indexes[attribute]
+    return index_notes(document.iter('node'), attribute)
@@ -0,0 +1,163 @@
+"""
+- Map profiler: opt-in timings, counts and memory peaks of the conversion
+  stages, reported as JSON or as log lines, with an optional cProfile of
+  the whole run.
+"""
+import json
+import time
+from contextlib import contextmanager, nullcontext
+
+# cProfile and tracemalloc are imported by the profilers using them: the
+# profiled modules import this one at their start.
+
+
+class Profiler():
+    """Timings of the named stages of a conversion.
+
+    A stage records its calls, the items counted by the caller, the
+    seconds spent and, with memory, the peak of the memory allocated
+    above the one at its start, as traced by tracemalloc. Stages may be
+    nested: a stage time includes the time of the stages it contains.
+    With cprofile, a cProfile of the run between start and stop is kept.
+    """
+    enabled = True
+
+    def __init__(self, memory=False, cprofile=False, **kwargs):
+        super().__init__()
+        self.memory = memory
+        self.tracemalloc = None
+        if memory:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+        self.stages = {}
+        self.cprofile = None
+        if cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+        # [memory at the start, peak] of the open stages
+        self.opened = []
+        self.tracing = False
+
+    def start(self):
+        """Start tracing the memory and the cProfile."""
+        tracemalloc = self.tracemalloc
+        if tracemalloc is not None and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.tracing = True
+        if self.cprofile is not None:
+            self.cprofile.enable()
+        return self
+
+    def stop(self):
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        if self.tracing:
+            self.tracemalloc.stop()
+            self.tracing = False
+
+    def record(self, name):
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = {'calls': 0, 'count': 0,
+                                          'seconds': 0.0, 'peak': 0}
+        return record
+
+    def add(self, name, seconds, count=0):
+        """Add a call of a stage timed by the caller."""
+        record = self.record(name)
+        record['calls'] += 1
+        record['count'] += count
+        record['seconds'] += seconds
+
+    @contextmanager
+    def stage(self, name):
+        """Time the enclosed code as a call of the stage name and yield its
+        record, whose count the caller may increase."""
+        record = self.record(name)
+        tracemalloc = self.tracemalloc
+        tracing = tracemalloc is not None and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.opened:
+                # The peak is reset: the enclosing stage keeps its own
+                self.opened[-1][1] = max(self.opened[-1][1], peak)
+            self.opened.append([current, 0])
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] += time.perf_counter() - start
+            record['calls'] += 1
+            if tracing:
+                current, peak = self.opened.pop()
+                peak = max(tracemalloc.get_traced_memory()[1], peak)
+                record['peak'] = max(record['peak'], peak - current)
+                if self.opened:
+                    self.opened[-1][1] = max(self.opened[-1][1], peak)
+
+    def wrap(self, function, name):
+        """Return function timed as a call of the stage name on each call,
+        as a skip predicate; None is returned as it is."""
+        if function is None:
+            return None
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - start)
+        return timed
+
+    def merge(self, report):
+        """Add the stages of a report, as made by a worker process."""
+        for name, stage in report.get('stages', {}).items():
+            record = self.record(name)
+            record['calls'] += stage['calls']
+            record['count'] += stage['count']
+            record['seconds'] += stage['seconds']
+            record['peak'] = max(record['peak'], stage['peak'])
+
+    def report(self):
+        """Return the stages as a dictionary, ready for JSON."""
+        return {'stages': {name: dict(record)
+                           for name, record in self.stages.items()}}
+
+    def dump(self, file):
+        """Write the report to a JSON file and the cProfile, if any, to
+        the file with the .pstats extension."""
+        with open(file, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+        if self.cprofile is not None:
+            self.cprofile.dump_stats(file + '.pstats')
+
+    def lines(self):
+        """Return the report as text lines, slowest stage first."""
+        stages = sorted(self.stages.items(), key=lambda s: -s[1]['seconds'])
+        return ['%-24s %8.3fs %7d calls %8d items %9.1f KiB peak' % (
+            name, s['seconds'], s['calls'], s['count'], s['peak'] / 1024)
+            for name, s in stages]
+
+
+class NullProfiler():
+    """A profiler doing nothing, the default of the profiled code."""
+    enabled = False
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def stage(self, name):
+        return nullcontext({'count': 0})
+
+    def add(self, name, seconds, count=0):
+        pass
+
+    def wrap(self, function, name):
+        return function
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,163 @@
+"""
+- Notes index: a full text index of the notes of many Kindle notes files,
+  stored in a SQLite FTS5 database and updated file by file.
+"""
+import hashlib
+import os
+import sqlite3
+
+from .mapbuilders import NotesParser, TITLE, SECTION, HEADING, TEXT
+from .mapmerge import section_title
+
+DEFAULT_INDEX = os.path.join(os.path.expanduser('~'), '.kindlenote',
+                             'index.sqlite')
+# Relative weights of the text, book, section and heading columns
+WEIGHTS = (10.0, 2.0, 2.0, 0.5)
+# Bytes read at once when hashing a file
+BLOCK_SIZE = 2**20
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    file TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    book TEXT,
+    notes INTEGER
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS notes USING fts5(
+    text, book, section, heading, file UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+'''
+
+
+def file_hash(file):
+    digest = hashlib.sha256()
+    with open(file, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_notes(document):
+    """Yield the (book, section, heading, text) of the notes of an
+    internal map."""
+    for center in document.getroot().iter('node'):
+        if center.get('_node_type') != TITLE:
+            continue
+        book = center.get('TEXT', '')
+        for section in center.iterfind('node'):
+            if section.get('_node_type') != SECTION:
+                continue
+            title = section_title(section)
+            for note in section.iterfind('node'):
+                if note.get('_node_type') != TEXT:
+                    continue
+                heading = next((e.get('TEXT', '') for e in note.iterfind('node')
+                                if e.get('_node_type') == HEADING), '')
+                yield book, title, heading, note.get('TEXT', '')
+
+
+def match_query(query):
+    """Return the FTS5 query of a user query: the words must all be
+    found, a text between double quotes is searched as a phrase."""
+    parts = query.split('"')
+    terms = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            if part.strip():
+                terms.append('"%s"' % (part.strip()))
+        else:
+            terms.extend('"%s"' % (word) for word in part.split())
+    return ' '.join(terms)
+
+
+class NotesIndex():
+    """Full text index of the notes of many files.
+
+    A file is indexed again only when its content changed. The results
+    of a search are ranked with BM25, the note text weighting most.
+    The database is opened at first use, by the thread using it.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX, **kwargs):
+        super().__init__()
+        self.path = path
+        self.kwargs = kwargs
+        self.db = None
+
+    def connect(self):
+        if self.db is None:
+            if self.path != ':memory:':
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                            exist_ok=True)
+            self.db = sqlite3.connect(self.path)
+            self.db.executescript(SCHEMA)
+        return self.db
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+    def is_indexed(self, file, digest):
+        row = self.connect().execute(
+            'SELECT hash FROM files WHERE file = ?', (file,)).fetchone()
+        return row is not None and row[0] == digest
+
+    def add_file(self, file, parser=None):
+        """Index the notes of a Kindle notes or FreeMind file, unless
+        already indexed with the same content. Return the number of
+        indexed notes, None when the file is unchanged or not parsed."""
+        file = os.path.abspath(file)
+        digest = file_hash(file)
+        if self.is_indexed(file, digest):
+            return None
+        parser = parser or NotesParser(stream=True, lean=True, **self.kwargs)
+        document = parser.parse(file)
+        if document is None:
+            return None
+        return self.add_document(file, document, digest)
+
+    def add_document(self, file, document, digest=''):
+        """Index the notes of an internal map as the notes of file,
+        replacing the ones indexed before. Return the number of notes."""
+        file = os.path.abspath(file)
+        rows = [(text, book, section, heading, file)
+                for book, section, heading, text in iter_notes(document)]
+        db = self.connect()
+        with db:
+            db.execute('DELETE FROM notes WHERE file = ?', (file,))
+            db.executemany('INSERT INTO notes (text, book, section, heading, '
+                           'file) VALUES (?, ?, ?, ?, ?)', rows)
+            db.execute('INSERT OR REPLACE INTO files (file, hash, book, notes) '
+                       'VALUES (?, ?, ?, ?)',
+                       (file, digest, rows[0][1] if rows else '', len(rows)))
+        return len(rows)
+
+    def remove_file(self, file):
+        file = os.path.abspath(file)
+        db = self.connect()
+        with db:
+            db.execute('DELETE FROM notes WHERE file = ?', (file,))
+            db.execute('DELETE FROM files WHERE file = ?', (file,))
+
+    def files(self):
+        """Return the (file, book, notes) of the indexed files."""
+        return self.connect().execute(
+            'SELECT file, book, notes FROM files ORDER BY file').fetchall()
+
+    def search(self, query, limit=20, raw=False):
+        """Return the best limit notes matching the query as dictionaries:
+        book, section, heading, text, file, snippet, rank. The query is
+        made by match_query, unless raw: then it is a FTS5 query."""
+        match = query if raw else match_query(query)
+        if not match:
+            return []
+        sql = ('SELECT book, section, heading, text, file, '
+               "snippet(notes, 0, '[', ']', '...', 16), "
+               'bm25(notes, %s) AS rank FROM notes WHERE notes MATCH ? '
+               'ORDER BY rank LIMIT ?' % (', '.join(map(str, WEIGHTS + (0,)))))
+        keys = ('book', 'section', 'heading', 'text', 'file', 'snippet',
+                'rank')
+        return [dict(zip(keys, row))
+                for row in self.connect().execute(sql, (match, limit))]
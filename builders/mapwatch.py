@@ -0,0 +1,212 @@
+"""
+- Map watcher: convert the Kindle notes files dropped into a directory as
+  they appear or change, over a bounded process pool, logging an event
+  per line as JSON.
+"""
+import datetime
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from .batch import find_files, convert_file
+from .mapsearch import file_hash
+
+# State of the converted files, in the output directory
+STATE_FILE = '.kindlenotes-watch.json'
+# Seconds between two scans of the directory
+INTERVAL = 1.0
+# Seconds a file must keep its size and time before it is converted
+SETTLE = 2.0
+
+
+def convert_changed(file, digest=None, output=None, cache=None, **options):
+    """Worker process: convert a file as convert_file does, unless its
+    content hash is digest. Return the convert_file summary with the
+    digest of the file and skipped, true if it was not converted."""
+    new = file_hash(file)
+    if new == digest:
+        return {'file': file, 'map': None, 'outputs': [], 'ok': True,
+                'nodes': 0, 'seconds': 0.0, 'logs': [], 'digest': new,
+                'skipped': True}
+    summary = convert_file(file, output, cache, **options)
+    summary.update(digest=new, skipped=False)
+    return summary
+
+
+class Watcher():
+    """
+    Scan a directory every interval seconds and convert its new and changed
+    notes files, see convert_file.
+    A file is converted once its modification time and size have not
+    changed for settle seconds, so that a file still being written is
+    left alone; a file whose content hash is the one last converted is
+    skipped. No more than window files are submitted to the pool of
+    workers processes at once, the others wait in a queue, and a file is
+    never queued twice; the outputs and the state file are never queued.
+    The time, size and hash of the converted files are kept in a JSON
+    state file, so a restarted watcher does not convert them again.
+    Events are written to out, a JSON object per line: time, event (start,
+    queued, converted, unchanged, failed, stop) and the event fields.
+    """
+
+    def __init__(self, directory, output=None, cache=None, workers=None,
+                 window=None, interval=INTERVAL, settle=SETTLE,
+                 recursive=False, state=None, out=None, **options):
+        super().__init__()
+        self.directory = directory
+        self.output = output
+        self.cache = cache
+        self.workers = workers
+        self.window = window or 2 * (workers or os.cpu_count() or 1)
+        self.interval = interval
+        self.settle = settle
+        self.recursive = recursive
+        self.options = options
+        self.out = out or sys.stdout
+        self.state_file = state or os.path.join(output or directory,
+                                                STATE_FILE)
+        # file: {'mtime', 'size', 'digest', 'ok'} of the last conversion
+        self.state = self.load_state()
+        self.changed = False
+        # file: ((mtime, size), first seen) of the files settling
+        self.settling = {}
+        # (file, (mtime, size)) waiting for a worker
+        self.queue = deque()
+        # future: (file, (mtime, size)) of the files being converted
+        self.running = {}
+        # Files queued or being converted
+        self.busy = set()
+
+    def log(self, event, **fields):
+        record = {'time': datetime.datetime.now().isoformat(
+            timespec='milliseconds'), 'event': event}
+        record.update(fields)
+        self.out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.out.flush()
+
+    def load_state(self):
+        try:
+            with open(self.state_file, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        """Write the state, if changed, replacing the file at once."""
+        if not self.changed:
+            return
+        tmp = self.state_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.state_file)
+        self.changed = False
+
+    def scan(self, now=None):
+        """Queue the files changed and settled since the last scan and
+        return their number."""
+        now = time.monotonic() if now is None else now
+        queued = 0
+        # The outputs of the converted files are left out by find_files
+        files = find_files([self.directory], recursive=self.recursive)
+        state = os.path.abspath(self.state_file)
+        for file in files:
+            if file in self.busy or \
+                    os.path.abspath(file) in (state, state + '.tmp'):
+                continue
+            try:
+                stat = os.stat(file)
+            except OSError:
+                # Removed meanwhile
+                continue
+            signature = (stat.st_mtime_ns, stat.st_size)
+            done = self.state.get(file)
+            if done and (done['mtime'], done['size']) == signature:
+                self.settling.pop(file, None)
+                continue
+            seen = self.settling.get(file)
+            if seen is None or seen[0] != signature:
+                self.settling[file] = (signature, now)
+                continue
+            if now - seen[1] < self.settle:
+                continue
+            del self.settling[file]
+            self.queue.append((file, signature))
+            self.busy.add(file)
+            queued += 1
+            self.log('queued', file=file)
+        # Forget the files removed while settling
+        if len(self.settling) > len(files):
+            files = set(files)
+            self.settling = {f: s for f, s in self.settling.items()
+                             if f in files}
+        return queued
+
+    def submit(self, executor):
+        """Submit the queued files to the workers, up to the window."""
+        while self.queue and len(self.running) < self.window:
+            file, signature = self.queue.popleft()
+            digest = self.state.get(file, {}).get('digest')
+            future = executor.submit(convert_changed, file, digest,
+                                     self.output, self.cache, **self.options)
+            self.running[future] = (file, signature)
+
+    def collect(self, futures):
+        """Record the summaries of the completed futures and return the
+        number of failed conversions."""
+        failed = 0
+        for future in futures:
+            file, signature = self.running.pop(future)
+            self.busy.discard(file)
+            try:
+                summary = future.result()
+            except Exception as e:
+                summary = {'file': file, 'ok': False, 'digest': None,
+                           'skipped': False, 'logs': [f'{e}']}
+            # A failed file is tried again once it changes
+            self.state[file] = {'mtime': signature[0], 'size': signature[1],
+                                'digest': summary['digest'] if summary['ok']
+                                else None, 'ok': summary['ok']}
+            self.changed = True
+            if summary['skipped']:
+                self.log('unchanged', file=file)
+            elif summary['ok']:
+                self.log('converted', file=file, outputs=summary['outputs'],
+                         nodes=summary['nodes'],
+                         seconds=round(summary['seconds'], 3),
+                         logs=summary['logs'])
+            else:
+                failed += 1
+                self.log('failed', file=file, logs=summary['logs'])
+        return failed
+
+    def run(self, once=False):
+        """Watch the directory until interrupted, or with once until the
+        files found by the first scans are converted. Return the number
+        of failed conversions."""
+        self.log('start', directory=self.directory, state=self.state_file)
+        failed = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                while True:
+                    self.scan()
+                    self.submit(executor)
+                    if self.running:
+                        done, _ = wait(self.running, timeout=self.interval,
+                                       return_when=FIRST_COMPLETED)
+                        failed += self.collect(done)
+                        self.save_state()
+                    elif once and not self.settling and not self.queue:
+                        break
+                    else:
+                        time.sleep(self.interval)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                for future in self.running:
+                    future.cancel()
+                self.save_state()
+        self.log('stop', failed=failed)
+        return failed
@@ -0,0 +1,368 @@
+"""
+- Map writers: serialize an internal map tree to FreeMind format as a
+  stream of text, skipping the filtered elements on the way, so no
+  filtered copy of the tree is built.
+- Free Map Writer: a map builder writing the FreeMind file while the notes
+  are parsed, without building the map tree.
+- Map copy: copy the XML text of a map to a FreeMind file while it is read,
+  skipping the filtered elements, without loading the map tree.
+"""
+import os
+import zlib
+import xml.etree.ElementTree as ET
+
+from .mapbuilders import FreeMapBuilder, build_key
+
+
+def escape_cdata(text):
+    """Escape an element text."""
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+def escape_attrib(text):
+    """Escape an attribute value as ElementTree does."""
+    text = escape_cdata(text)
+    if '"' in text:
+        text = text.replace('"', '&quot;')
+    if '\r' in text:
+        text = text.replace('\r', '&#13;')
+    if '\n' in text:
+        text = text.replace('\n', '&#10;')
+    if '\t' in text:
+        text = text.replace('\t', '&#09;')
+    return text
+
+
+def start_tag(element):
+    """Return the start tag of an element, without the closing bracket."""
+    return '<' + element.tag + ''.join(f' {k}="{escape_attrib(v)}"'
+                                       for k, v in element.items())
+
+
+def iter_events(element, skip=None):
+    """Walk element and its subtree in document order, leaving out the
+    elements for which skip(element) is true together with their subtree.
+    Yield (True, element, children) as an element starts and (False,
+    element, children) as it ends, children being the ones left."""
+    stack = [(element, None)]
+    while stack:
+        item, children = stack.pop()
+        if children is not None:
+            yield False, item, children
+            continue
+        children = [e for e in item if skip is None or not skip(e)]
+        yield True, item, children
+        stack.append((item, children))
+        stack.extend((e, None) for e in reversed(children))
+
+
+def xml_start(element, children):
+    """Return the XML text of an element start, see iter_events."""
+    tag = element.tag
+    if tag is ET.Comment:
+        return f'<!--{element.text}-->'
+    if tag is ET.ProcessingInstruction:
+        return f'<?{element.text}?>'
+    if element.text:
+        return start_tag(element) + '>' + escape_cdata(element.text)
+    if children:
+        return start_tag(element) + '>'
+    return start_tag(element) + ' />'
+
+
+def xml_end(element, children):
+    """Return the XML text of an element end, with its tail."""
+    tag = element.tag
+    end = ''
+    if tag is not ET.Comment and tag is not ET.ProcessingInstruction and \
+            (element.text or children):
+        end = f'</{tag}>'
+    if element.tail:
+        end += escape_cdata(element.tail)
+    return end
+
+
+def iter_xml(element, skip=None):
+    """Yield the XML text of element and its subtree, leaving out the
+    elements for which skip(element) is true together with their subtree.
+    The text is the same ElementTree.write would produce once the skipped
+    elements were removed from the tree."""
+    for start, item, children in iter_events(element, skip):
+        text = xml_start(item, children) if start else xml_end(item, children)
+        if text:
+            yield text
+
+
+def write_document(document, file, skip=None):
+    """Write an ElementTree to a FreeMind file, see iter_xml."""
+    with open(file, 'w', encoding='utf-8', errors='xmlcharrefreplace',
+              newline='\n') as f:
+        f.writelines(iter_xml(document.getroot(), skip))
+
+
+# Depth of the elements copied whole by copy_map: the notes of a map
+COPY_DEPTH = 3
+
+
+def copy_map(blocks, out, skip=None, depth=COPY_DEPTH):
+    """Copy the XML text of an internal map, read as an iterable of byte
+    blocks, to the text file out, leaving out the elements for which
+    skip(element) is true together with their subtree. Return the number
+    of written nodes.
+    The elements at depth, the notes, are written with their subtree once
+    complete, as iter_xml does, and then dropped; the elements above are
+    written as they are read, so skip sees their attributes only. Only
+    the open elements and one note are held in memory. The comments of
+    the open elements are copied; the text between the elements, not
+    written by the map builders, is not."""
+    parser = ET.XMLPullParser(events=('start', 'end', 'comment'))
+    # [element, written, start tag not closed yet] from the root
+    stack = []
+    nodes = 0
+
+    def close_start(entry):
+        # The start tag of an open element gets its bracket and its text
+        if entry[2]:
+            out.write('>' + escape_cdata(entry[0].text or ''))
+            entry[2] = False
+
+    def handle(event, element):
+        nonlocal nodes
+        if event == 'comment':
+            if len(stack) <= depth and stack and stack[-1][1]:
+                close_start(stack[-1])
+                out.write(f'<!--{element.text}-->')
+            return
+        if event == 'start':
+            level = len(stack)
+            written = None
+            if level < depth:
+                written = (not stack or stack[-1][1]) and \
+                    (skip is None or not skip(element))
+                if written:
+                    if stack:
+                        close_start(stack[-1])
+                    out.write(start_tag(element))
+                    if element.tag == 'node':
+                        nodes += 1
+            stack.append([element, written, bool(written)])
+            return
+        entry = stack.pop()
+        level = len(stack)
+        if level > depth:
+            return
+        if level == depth:
+            parent = stack[-1]
+            if parent[1] and (skip is None or not skip(element)):
+                close_start(parent)
+                for text in iter_xml(element, skip):
+                    if text.startswith('<node'):
+                        nodes += 1
+                    out.write(text)
+        elif entry[1]:
+            if entry[2] and not element.text:
+                out.write(' />')
+            else:
+                close_start(entry)
+                out.write(f'</{element.tag}>')
+        if stack:
+            # The element was the only child left of its parent
+            del stack[-1][0][:]
+
+    for block in blocks:
+        parser.feed(block)
+        for event, element in parser.read_events():
+            handle(event, element)
+    parser.close()
+    for event, element in parser.read_events():
+        handle(event, element)
+    return nodes
+
+
+class FreeMapWriter(FreeMapBuilder):
+    """
+    FreeMapBuilder writing the FreeMind map to a text file while it is
+    built: the nodes are written and dropped as soon as they are complete,
+    only the map, the book title and the current section are kept open,
+    so the memory does not grow with the notes; with the dedupe keyword
+    the notes are written at the end of their section. The output is the
+    one of write_document on the built map; the elements for which
+    skip(element) is true are left out.
+    The map is also written to the raw keyword, a text file, when given,
+    with no element left out.
+    """
+
+    def __init__(self, out, skip=None, raw=None, **kwargs):
+        super().__init__(**kwargs)
+        self.out = out
+        self.skip = skip
+        # (file, skip) the map is written to: nodes are counted in the first
+        self.outputs = [(out, skip)]
+        if raw is not None:
+            self.outputs.append((raw, None))
+        # Open elements: (element, written to each output) from the map down
+        self.opened = []
+        self.nodes = 0
+
+    def _write(self, element, written=None):
+        """Write element and its subtree to the outputs, to the ones
+        where its parent is written when given."""
+        for i, (out, skip) in enumerate(self.outputs):
+            if (written is None or written[i]) and \
+                    (skip is None or not skip(element)):
+                for text in iter_xml(element, skip):
+                    if not i and text.startswith('<node'):
+                        self.nodes += 1
+                    out.write(text)
+
+    def _open(self, element):
+        parent = self.opened[-1][1] if self.opened else None
+        written = []
+        for i, (out, skip) in enumerate(self.outputs):
+            is_written = (parent is None or parent[i]) and \
+                (skip is None or not skip(element))
+            if is_written:
+                out.write(start_tag(element) + '>')
+                if not i and element.tag == 'node':
+                    self.nodes += 1
+            written.append(is_written)
+        self.opened.append((element, written))
+
+    def _close(self, depth):
+        """Write the remaining children and the end tag of the open
+        elements from depth down."""
+        while len(self.opened) > depth:
+            element, written = self.opened.pop()
+            for child in element:
+                self._write(child, written)
+            for (out, _), is_written in zip(self.outputs, written):
+                if is_written:
+                    out.write(f'</{element.tag}>')
+            del element[:]
+
+    def _flush(self):
+        """Write the complete nodes and open the new open elements."""
+        path = [e for e in (self.root, self.center, self.chapter)
+                if e is not None]
+        for depth, element in enumerate(path):
+            if depth < len(self.opened) and self.opened[depth][0] is not element:
+                self._close(depth)
+            if depth == len(self.opened):
+                self._open(element)
+                if depth:
+                    # The open element is kept by the builder
+                    path[depth - 1].remove(element)
+            next_open = path[depth + 1] if depth + 1 < len(path) else None
+            if depth + 1 < len(self.opened):
+                if self.opened[depth + 1][0] is next_open:
+                    # Later children wait for the open child to be closed
+                    continue
+                self._close(depth + 1)
+            written = self.opened[depth][1]
+            while len(element) and element[0] is not next_open:
+                self._write(element[0], written)
+                del element[0]
+
+    def XMLroot(self, element='map', **kwargs):
+        super().XMLroot(element, **kwargs)
+        self.opened = []
+
+    def bookTitle(self, element, **kwargs):
+        text = super().bookTitle(element, **kwargs)
+        self._flush()
+        return text
+
+    def authors(self, element, **kwargs):
+        text = super().authors(element, **kwargs)
+        self._flush()
+        return text
+
+    def citation(self, element, **kwargs):
+        text = super().citation(element, **kwargs)
+        self._flush()
+        return text
+
+    def sectionHeading(self, element, **kwargs):
+        text = super().sectionHeading(element, **kwargs)
+        self._flush()
+        return text
+
+    def noteText(self, element, **kwargs):
+        text = super().noteText(element, **kwargs)
+        if self.deduper is None:
+            # A note collapsing into an earlier one needs it unwritten
+            self._flush()
+        return text
+
+    def close(self):
+        """Write the end of the map."""
+        self._flush()
+        self._close(0)
+
+
+def copy_cached(cache, key, mm, skip=None):
+    """Copy the map cached with key to the FreeMind file mm, see copy_map.
+    Return the number of written nodes, None on a miss; a damaged entry
+    is removed."""
+    if key not in cache:
+        return None
+    try:
+        with open(mm, 'w', encoding='utf-8', errors='xmlcharrefreplace',
+                  newline='\n') as f:
+            return copy_map(cache.blocks(key), f, skip)
+    except (zlib.error, ET.ParseError):
+        cache.remove(key)
+    return None
+
+
+def write_notes(parser, file, mm, skip=None):
+    """Convert a Kindle notes file straight to the FreeMind file mm with a
+    FreeMapWriter, fed by the streaming parser of a NotesParser and made
+    with its keywords. Return the number of written nodes, None on
+    failure: the file mm is then left as it was.
+    With the cache of the parser, a cached map is copied while read, else
+    the map is also written to the cache while parsed, both in constant
+    memory."""
+    tmp = mm + '.tmp'
+    entry = None
+    try:
+        cache = parser.cache
+        if cache is not None:
+            with parser.profiler.stage('cache.get') as stage:
+                key = cache.key(file, build_key(**parser.kwargs))
+                nodes = copy_cached(cache, key, tmp, skip)
+                if nodes is not None:
+                    stage['count'] += 1
+                    os.replace(tmp, mm)
+                    return nodes
+            entry = cache.entry(key)
+        with open(tmp, 'w', encoding='utf-8', errors='xmlcharrefreplace',
+                  newline='\n') as f:
+            writer = FreeMapWriter(f, skip=skip, raw=entry, logs=parser.logs,
+                                   **parser.kwargs)
+            writer.XMLroot()
+            with parser.profiler.stage('parse.html+write') as stage:
+                done = parser.feed(file, writer)
+                if done:
+                    writer.close()
+                stage['count'] += os.path.getsize(file)
+        if done:
+            os.replace(tmp, mm)
+            if entry is not None:
+                with parser.profiler.stage('cache.put'):
+                    entry.commit()
+                entry = None
+            return writer.nodes
+    except Exception as e:
+        parser.logs.append(f'{e}')
+    if entry is not None:
+        entry.abort()
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    return None
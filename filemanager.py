@@ -52,7 +52,17 @@ def decision(title, text, fn_ok=None, fn_canc=None, ok_kwargs=None, canc_kwargs=
     decision_popup.open()
 
 
-Builder.load_file('filemanager.kv')
+# The popups rules are loaded at the first popup
+KV_FILE = 'filemanager.kv'
+kv_loaded = False
+
+
+def load_kv():
+    """Load the kv rules of the popups, once."""
+    global kv_loaded
+    if not kv_loaded:
+        Builder.load_file(KV_FILE)
+        kv_loaded = True
 
 
 class OpenFilePopup(Popup):
@@ -60,6 +70,7 @@ class OpenFilePopup(Popup):
     filechooser = ObjectProperty(None)
 
     def __init__(self, *args, **kwargs):
+        load_kv()
         super(OpenFilePopup, self).__init__(**kwargs)
         #self.filechooser.rootpath = os.getcwd()
         self.home = os.getcwd()
@@ -86,6 +97,7 @@ class SaveFilePopup(Popup):
     filechooser = ObjectProperty(None)
 
     def __init__(self, *args, **kwargs):
+        load_kv()
         super(SaveFilePopup, self).__init__(**kwargs)
         self.home = os.getcwd()
         self.filechooser.path = self.home
@@ -109,6 +121,7 @@ class MessagePopup(Popup):
     pr_image = ObjectProperty(None)
 
     def __init__(self, *args, **kwargs):
+        load_kv()
         super(MessagePopup, self).__init__(**kwargs)
 
 
@@ -121,6 +134,7 @@ class DecisionPopup(Popup):
     canc_kwargs = ObjectProperty(None)
 
     def __init__(self, title='', text='', *args, **kwargs):
+        load_kv()
         super(DecisionPopup, self).__init__(**kwargs)
         self.pr_message.text = text
         self.title = title
@@ -12,6 +12,7 @@
             _swi_ : switch widget
             _scr_ : scroll widget
             _prb_ : progress bar widget
+            _rv_  : recycle view widget
 
         - Define kivy properties prefixes:
 
@@ -23,21 +24,36 @@
             Fields are dictionary key - value, the input field in a .kv screen
             is _inp_key, the kivy property is pr_key.
 """
-from bs4 import BeautifulSoup, Tag
-from builders.mapbuilders import FreeMapBuilder, NotesParser, explore, remove_pages
+from builders.mapbuilders import FreeMapBuilder, NotesParser, explore, HASH_IDS
+from builders.mapcache import MapCache
+from builders.mapexporters import EXPORTERS, export, exporter
+from builders.mapfilters import MapFilter
+from builders.mapmerge import merge_document
+from builders.mapoutline import Outline
+from builders.mapprofile import Profiler, NULL_PROFILER
+from builders.mapsearch import NotesIndex
 import base64
 import json
 import re
 import os
 import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import appconfig as conf
 import kivy
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.behaviors import ButtonBehavior
+from kivy.uix.label import Label
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.uix.widget import Widget
 from kivy.lang.builder import Builder
 from kivy.properties import ObjectProperty
 from kivy.properties import StringProperty
+from kivy.properties import BooleanProperty
+from kivy.properties import NumericProperty
 from filemanager import OpenFilePopup, SaveFilePopup, message, decision
 dummy = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(dummy)
@@ -59,6 +75,9 @@ _ = conf.translate(['it'])
 
 Builder.load_file('user_interface.kv')
 
+# Log lines kept on screen
+LOG_LINES = 500
+
 
 class OpenFile(OpenFilePopup):
 
@@ -84,12 +103,32 @@ class OpenFile(OpenFilePopup):
         return os.path.isdir(file) or os.path.splitext(file)[1] in ['.html', '.xml', '.mm']
 
 
+class OutlineRow(RecycleDataViewBehavior, ButtonBehavior, Label):
+    """A row of the content outline: a click expands or collapses it."""
+    index = NumericProperty(0)
+    title = StringProperty('')
+    level = NumericProperty(0)
+    expandable = BooleanProperty(False)
+    expanded = BooleanProperty(False)
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.index = index
+        return super(OutlineRow, self).refresh_view_attrs(rv, index, data)
+
+    def on_release(self):
+        if self.expandable:
+            App.get_running_app().root.toggle(self.index)
+
+
 class NotesManagerWidget(BoxLayout):
     """App enter screen."""
 
     def __init__(self, *args, **kwargs):
         super(NotesManagerWidget, self).__init__(**kwargs)
         # App.get_running_app
+        # Outline of the content, None for plain text rows
+        self.outline = None
+        self.logs = deque(maxlen=LOG_LINES)
 
     def open(self):
         popup = OpenFile()
@@ -100,16 +139,37 @@ class NotesManagerWidget(BoxLayout):
         App.get_running_app().stop()
 
     def log(self, log):
-        self.ids._out_log.text += f'\n>{log}'
+        self.logs.append(f'>{log}')
+        self.ids._out_log.text = '\n'.join(
+            [_('App Logs:')] + list(self.logs))
 
     def content(self, content):
-        self.ids._out_content.text += f'\n{content}'
+        """Append text rows to the content."""
+        self.ids._rv_content.data.extend(
+            {'title': line, 'level': 0, 'expandable': False, 'expanded': False}
+            for line in content.split('\n'))
+
+    def show_outline(self, outline):
+        """Show the outline of a document as the content."""
+        self.outline = outline
+        self.ids._rv_content.data = list(outline.rows)
+
+    def toggle(self, index):
+        """Expand or collapse the content outline row at index."""
+        if self.outline is not None:
+            start, stop, rows = self.outline.toggle(index)
+            self.ids._rv_content.data[start:stop] = rows
+
+    def progress(self, value):
+        self.ids._prb_progress.value = value
 
     def clear_content(self):
-        self.ids._out_content.text = _('Parsed content:\n\n')
+        self.outline = None
+        self.ids._rv_content.data = []
 
     def clear_log(self):
-        self.ids._out_log.text = _('App Logs:\n')
+        self.logs.clear()
+        self.ids._out_log.text = _('App Logs:')
 
     def update_gui(self, **kwargs):
         self.ids._inp_chapter_low.text = str(
@@ -124,7 +184,9 @@ class NotesManagerWidget(BoxLayout):
             'section_range': (self.ids._inp_chapter_low.text, self.ids._inp_chapter_high.text),
             'level_low': self.ids._inp_level_low.text,
             'pages': self.ids._chk_page_on.active == True,
-            'summary': self.ids._chk_summary_on.active == True
+            'summary': self.ids._chk_summary_on.active == True,
+            'merge': self.ids._chk_merge_on.active == True,
+            'dedupe': self.ids._chk_dedupe_on.active == True
         }
 
 
@@ -141,6 +203,14 @@ class KindleNotesApp(App):
         self.builder = None
         # Internal document
         self.document = None
+        # Built documents cache
+        self.cache = MapCache()
+        # Full text index of the opened files, used by the worker thread
+        self.index = NotesIndex()
+        # Documents are built by a worker thread, one at a time
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # Cancel event of the document being built
+        self.cancel = None
 
     def build(self):
         self.title = 'KindleNotes %s' % (__version__)
@@ -182,6 +252,10 @@ class KindleNotesApp(App):
     def on_stop(self):
         """Event handler for the on_stop event which is fired when the application
         has finished running (i.e. the window is about to be closed)."""
+        if self.cancel is not None:
+            self.cancel.set()
+        self.executor.submit(self.index.close)
+        self.executor.shutdown(wait=False)
         return super().on_stop()
 
     def open(self, file):
@@ -197,50 +271,70 @@ class KindleNotesApp(App):
 
     def write_map(self):
         """Transform from internal document to FreeMind"""
-        if self.file and self.document:
-            try:
-                # Options take effect here:
-                # Include page positions: _TYPE': HEADING
-
-                document = self.filter_document()
-
-                file = '%s.mm' % (self.file)
-                document.write(file, encoding='utf-8', xml_declaration=False)
-                self.log(_('Saved to map: %s') % (file))
-            except Exception as err:
-                self.log(_('Error creating map: %s') % (err))
-        else:
-            self.log(_('No file was loaded'))
+        self.write_formats(['mm'])
 
     def write_html(self):
         """Transform from internal document to html"""
+        self.write_formats(['html'])
+
+    def write_all(self):
+        """Transform from internal document to every export format"""
+        self.write_formats(list(EXPORTERS))
+
+    def write_formats(self, formats):
+        """Write the internal document to <file>.<format> for each format,
+        in a single walk of the document, see mapexporters. With the merge
+        option the new notes are appended to an existing map."""
         if self.file and self.document:
-            # self.builder = HtmlMapBuilder()
             try:
-                self.log(_('Option not available'))
+                # Options take effect here:
+                # Include page positions: _TYPE': HEADING
+
+                profiler = self.profiler()
+                skip = profiler.wrap(self.filter_document(), 'filter')
+
+                exporters = []
+                for format in formats:
+                    file = '%s.%s' % (self.file, format)
+                    if format == 'mm' and self.root.get_options().get('merge') \
+                            and os.path.exists(file):
+                        with profiler.stage('merge'):
+                            sections, notes = merge_document(
+                                self.document, file, skip=skip)
+                        self.log(_('Merged %d notes and %d sections to map: %s') % (
+                            notes, sections, file))
+                    else:
+                        exporters.append(exporter(format, file))
+                if exporters:
+                    with profiler.stage('write.' + '+'.join(
+                            e.EXTENSION[1:] for e in exporters)):
+                        export(self.document, exporters, skip=skip)
+                    for e in exporters:
+                        self.log(_('Saved to: %s') % (e.file))
+                self.log_profile(profiler)
             except Exception as err:
-                self.log(_('Error creating map: %s') % (file))
+                self.log(_('Error saving: %s') % (err))
         else:
             self.log(_('No file was loaded'))
 
     def filter_document(self):
         """Apply formatting options to the document. 
-        Return a document."""
-        document = self.document
-        options = self.root.get_options()
-
-        if options.get('section_range', None):
-            pass
-        if options.get('level_range', None):
-            pass
-        if options.get('pages', None): # include pages
-            pass
-        else: # remove page numbers
-            document = remove_pages(self.document)
-        if options.get('summary', None):
-            pass
-
-        return document
+        Return a predicate of the elements to skip while writing."""
+        return MapFilter.from_options(
+            self.root.get_options()).prepare(self.document)
+
+    def profiler(self):
+        """Return a started Profiler when profiling, see appconfig."""
+        if conf.PROFILE:
+            return Profiler(memory=conf.PROFILE_MEMORY).start()
+        return NULL_PROFILER
+
+    def log_profile(self, profiler):
+        """Log the stages of a profiler, if profiling."""
+        if profiler.enabled:
+            profiler.stop()
+            for line in profiler.lines():
+                self.log(line)
 
     def content(self, text):
         """Log action"""
@@ -258,25 +352,103 @@ class KindleNotesApp(App):
         """
         Build internal document: parse the file to FreeMap format.
         This format is the starting point for converting to other ones.
+        The document is built by a worker thread, the building of the
+        previous file is cancelled.
         """
-        parser = NotesParser()
-        self.document = parser.parse(self.file)
-        logs = parser.getlogs()
+        if self.cancel is not None:
+            self.cancel.set()
+        self.cancel = cancel = threading.Event()
+        self.document = None
+        self.root.progress(0)
+        self.executor.submit(self._build_document, self.file, cancel,
+                             self.root.get_options().get('dedupe'))
+
+    def _build_document(self, file, cancel, dedupe=False):
+        """Worker thread: parse and explore the file, the results are
+        passed to the main thread."""
+        def progress(done, total):
+            Clock.schedule_once(
+                lambda dt: self.on_progress(cancel, 100 * done / total))
+
+        logs = []
+        document = docinfo = None
+        profiler = self.profiler()
+        try:
+            parser = NotesParser(stream=True, cache=self.cache, ids=HASH_IDS,
+                                 dedupe=dedupe, progress=progress,
+                                 cancel=cancel, profiler=profiler)
+            document = parser.parse(file)
+            logs = parser.getlogs()
+            if document and not cancel.is_set():
+                with profiler.stage('explore'):
+                    docinfo = explore(document, text=False)
+                try:
+                    self.index.add_document(file, document)
+                except Exception as err:
+                    logs.append(_('Indexing failed: %s') % (err))
+        except Exception as err:
+            logs.append(f'{err}')
+            document = None
+        Clock.schedule_once(
+            lambda dt: self.on_document(cancel, document, docinfo, logs,
+                                        profiler))
+
+    def search(self, query):
+        """Search the notes of the opened files, on the worker thread
+        owning the index."""
+        if query.strip():
+            self.executor.submit(self._search, query)
+
+    def _search(self, query):
+        """Worker thread: search the index, the results are passed to the
+        main thread."""
+        try:
+            results, err = self.index.search(query), None
+        except Exception as e:
+            results, err = [], f'{e}'
+        Clock.schedule_once(lambda dt: self.on_search(query, results, err))
+
+    def on_search(self, query, results, err):
+        """Main thread: show the notes found."""
+        if err:
+            self.root.log(_('Search failed: %s') % (err))
+            return
+        self.root.clear_content()
+        self.root.log(_('Found %d notes for: %s') % (len(results), query))
+        for result in results:
+            self.root.content('[%s] %s - %s\n%s\n' % (
+                result['book'], result['section'], result['heading'],
+                result['text']))
+
+    def on_progress(self, cancel, value):
+        """Main thread: show the building progress."""
+        if not cancel.is_set():
+            self.root.progress(value)
+
+    def on_document(self, cancel, document, docinfo, logs,
+                    profiler=NULL_PROFILER):
+        """Main thread: show the built document, unless cancelled."""
+        if cancel.is_set():
+            profiler.stop()
+            return
+        self.cancel = None
+        self.document = document
         # Logging
         for log in logs:
             self.root.log(log)
 
         if self.document:
-            docinfo = explore(self.document)
             self.root.log(_('Conversion ok'))
-            self.root.content(docinfo['text'][0:5000])
+            with profiler.stage('outline'):
+                self.root.show_outline(Outline(self.document))
             self.root.update_gui(
                 chapter_range=(1, docinfo['max_section_counter']),
                 level_range=(1, docinfo['max_node_level'])
             )
         else:
             self.root.log(_('Conversion failed'))
-
+        self.log_profile(profiler)
+        self.root.progress(100)
 
 if __name__ == '__main__':
     KindleNotesApp().run()
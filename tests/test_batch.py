@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+from builders.batch import convert_file, find_files
+
+NOTES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'notes.html')
+
+
+class FindFilesTest(unittest.TestCase):
+
+    def test_outputs_left_out(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ('notes.html', 'notes.html.html', 'notes.html.mm',
+                         'other.html'):
+                open(os.path.join(tmp, name), 'w').close()
+            files = [os.path.basename(f) for f in find_files([tmp])]
+        self.assertEqual(files, ['notes.html', 'other.html'])
+
+    def test_outputs_of_maps_left_out(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ('notes.html', 'notes.html.mm', 'plain.mm',
+                         'plain.mm.html', 'plain.mm.mm'):
+                open(os.path.join(tmp, name), 'w').close()
+            files = [os.path.basename(f)
+                     for f in find_files([tmp], extensions=('.html', '.mm'))]
+        self.assertEqual(files, ['notes.html', 'plain.mm'])
+
+
+class ConvertFileTest(unittest.TestCase):
+
+    def test_written_nodes_counted_on_every_path(self):
+        counts = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for format in ('mm', ['mm', 'md'], 'md'):
+                summary = convert_file(NOTES, output=tmp, format=format,
+                                       ids='hash', summary=True)
+                self.assertTrue(summary['ok'], summary['logs'])
+                counts.append(summary['nodes'])
+        self.assertEqual(len(set(counts)), 1, counts)
+        self.assertGreater(counts[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
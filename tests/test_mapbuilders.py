@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from builders.mapbuilders import (FreeMapBuilder, NotesParser, explore,
+                                  sniff, HTML, TITLE, ID_STRATEGIES,
+                                  COUNTER_IDS, HASH_IDS, IDGenerator,
+                                  IDNumbers)
+
+NOTES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'notes.html')
+
+
+class SniffTest(unittest.TestCase):
+
+    def sniff_text(self, text):
+        with tempfile.TemporaryDirectory() as tmp:
+            file = os.path.join(tmp, 'notes.html')
+            with open(file, 'w', encoding='utf-8') as f:
+                f.write(text)
+            return sniff(file)
+
+    def test_class_attribute_quoting(self):
+        for div in ('<div class="bookTitle">', "<div class='bookTitle'>",
+                    '<div class=bookTitle>', '<div class="x bookTitle">'):
+            self.assertEqual(
+                self.sniff_text(f'<html><body>{div}Book</div>'), HTML, div)
+
+    def test_other_classes(self):
+        for div in ('<div class="bookTitles">', '<div data-class="bookTitle">'):
+            self.assertIsNone(
+                self.sniff_text(f'<html><body>{div}Book</div>'), div)
+
+    def test_single_quoted_export(self):
+        with open(NOTES, encoding='utf-8') as f:
+            text = f.read().replace('class="', "class='").replace(
+                '">', "'>")
+        with tempfile.TemporaryDirectory() as tmp:
+            file = os.path.join(tmp, 'notes.html')
+            with open(file, 'w', encoding='utf-8') as f:
+                f.write(text)
+            for stream in (True, False):
+                document = NotesParser(stream=stream).parse(file)
+                self.assertIsNotNone(document)
+                titles = [e.get('TEXT') for e in document.iter('node')
+                          if e.get('_node_type') == TITLE]
+                self.assertEqual(len(titles), 1)
+
+
+class StreamParserTest(unittest.TestCase):
+
+    def test_stream_as_soup(self):
+        for dedupe in (False, True):
+            trees = [ET.tostring(NotesParser(stream=stream, ids='hash', now=0,
+                                             dedupe=dedupe)
+                                 .parse(NOTES).getroot())
+                     for stream in (True, False)]
+            self.assertEqual(trees[0], trees[1])
+
+
+def build_repeated(ids, notes=200):
+    """Build a map of a book with the same note repeated in two identical
+    sections."""
+    builder = FreeMapBuilder(ids=ids, now=0)
+    builder.XMLroot()
+    builder.bookTitle('Book')
+    builder.authors('Author')
+    for _ in range(2):
+        builder.sectionHeading('Chapter')
+        for _ in range(notes):
+            builder.noteHeading('Highlight (yellow) - Page 1 · Location 10')
+            builder.noteText('The same note')
+    return [e.get('ID') for e in builder.get_document().iter('node')]
+
+
+class IDStrategiesTest(unittest.TestCase):
+
+    def test_unique(self):
+        for strategy in ID_STRATEGIES:
+            ids = build_repeated(strategy)
+            self.assertEqual(len(ids), 2 + 2 * (1 + 2 * 200), strategy)
+            self.assertEqual(len(set(ids)), len(ids), strategy)
+
+    def test_deterministic(self):
+        for strategy in (COUNTER_IDS, HASH_IDS):
+            self.assertEqual(build_repeated(strategy),
+                             build_repeated(strategy), strategy)
+
+    def test_false_positives(self):
+        # A small filter finds numbers never added: they are skipped
+        def generator():
+            ids = IDGenerator(HASH_IDS)
+            ids.numbers = IDNumbers(bits=2**12)
+            return ids
+        ids = build_repeated(generator())
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(build_repeated(generator()), ids)
+
+
+class ExploreTest(unittest.TestCase):
+
+    def test_counters_without_text(self):
+        document = NotesParser(stream=True).parse(NOTES)
+        info = explore(document)
+        counters = explore(document, text=False)
+        self.assertEqual(counters, {
+            'max_node_level': info['max_node_level'],
+            'max_section_counter': info['max_section_counter']})
+        self.assertTrue(info['text'])
+
+
+if __name__ == '__main__':
+    unittest.main()
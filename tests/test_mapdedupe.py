@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+from builders.mapbuilders import NotesParser, TEXT
+from builders.mapmodel import ModelBuilder
+
+LONG = 'the quick brown fox jumps over the lazy dog by the river'
+
+# (location, note) of a section, in the order of the export
+NOTES = (
+    (10, 'ok'),
+    # The same short note far away: another highlight
+    (500, 'ok'),
+    # The same short note at a nearby location: a repetition
+    (12, 'ok'),
+    (20, LONG),
+    # A long note is a repetition wherever it is
+    (900, LONG),
+    # A longer highlight containing the long note replaces it
+    (20, LONG + ' at dawn'),
+    (14, 'OK'),
+    # A short note without a location is never collapsed
+    (None, 'ok'),
+)
+
+
+def write_notes(file):
+    divs = ['<html><body><div class="bookTitle">Book</div>',
+            '<div class="sectionHeading">Chapter</div>']
+    for location, text in NOTES:
+        heading = 'Highlight (yellow) - Page 1'
+        if location is not None:
+            heading += f' · Location {location}'
+        divs.append(f'<div class="noteHeading">{heading}</div>')
+        divs.append(f'<div class="noteText">{text}</div>')
+    divs.append('</body></html>')
+    with open(file, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(divs))
+
+
+class DedupeTest(unittest.TestCase):
+
+    def test_collapsed_notes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            file = os.path.join(tmp, 'notes.html')
+            write_notes(file)
+            for stream, builder in ((True, None), (False, None),
+                                    (True, ModelBuilder)):
+                parser = NotesParser(stream=stream, builder=builder,
+                                     dedupe=True)
+                document = parser.parse(file)
+                notes = [e.get('TEXT') for e in document.iter('node')
+                         if e.get('_node_type') == TEXT]
+                self.assertEqual(notes, ['ok', 'ok', LONG + ' at dawn', 'ok'])
+                self.assertEqual(parser.getlogs(), [
+                    'Collapsed a repeated note in section 0 Chapter: ok',
+                    'Collapsed a repeated note in section 0 Chapter: ' + LONG,
+                    'Merged a note into a longer one in section 0 Chapter: ' +
+                    (LONG + ' at dawn')[:60],
+                    'Collapsed a repeated note in section 0 Chapter: OK',
+                ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import unittest
+
+from builders.mapbuilders import NotesParser
+from builders.mapexporters import export, exporter
+from builders.mapfilters import MapFilter
+from builders.mapwriters import write_document
+
+NOTES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'notes.html')
+
+
+def read(file):
+    with open(file, encoding='utf-8') as f:
+        return f.read()
+
+
+class ExportTest(unittest.TestCase):
+
+    def test_freemind_as_write_document(self):
+        document = NotesParser(stream=True, ids='hash', now=0).parse(NOTES)
+        for skip in (None, MapFilter(pages=False)):
+            with tempfile.TemporaryDirectory() as tmp:
+                expected = os.path.join(tmp, 'expected.mm')
+                write_document(document, expected, skip=skip)
+                mm = os.path.join(tmp, 'notes.mm')
+                export(document, [exporter('mm', mm)], skip)
+                self.assertEqual(read(mm), read(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import unittest
+
+from builders.mapbuilders import NotesParser, TEXT
+from builders.mapfilters import MapFilter
+from builders.mapmodel import ModelBuilder
+from builders.mappositions import LOCATION, PAGE, index_positions, note_value
+from builders.mapwriters import iter_xml
+
+NOTES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'notes.html')
+
+
+class PositionRangeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.document = NotesParser(stream=True, ids='hash', now=0).parse(NOTES)
+        cls.model = NotesParser(stream=True, ids='hash', now=0,
+                                builder=ModelBuilder).parse(NOTES)
+
+    def test_index_between(self):
+        index = index_positions(self.document, LOCATION)
+        notes = index.between(60, 80)
+        self.assertEqual([note_value(n, LOCATION) for n in notes],
+                         [66, 68, 68, 77])
+
+    def test_kept_index_as_built(self):
+        for attribute in (PAGE, LOCATION):
+            kept = index_positions(self.model, attribute)
+            built = index_positions(self.document, attribute)
+            self.assertEqual(kept.positions, built.positions)
+            self.assertEqual([n.get('ID') for n in kept.notes],
+                             [n.get('ID') for n in built.notes])
+
+    def test_prepared_filter_as_unprepared(self):
+        options = {'page_range': ('10', '20'), 'location_range': (None, 150)}
+        root = self.document.getroot()
+        scanned = ''.join(iter_xml(root, MapFilter(**options)))
+        self.assertIsNone(MapFilter(**options).prepare(self.document).kept)
+        prepared = MapFilter(**options).prepare(self.model)
+        self.assertTrue(prepared.kept)
+        self.assertEqual(''.join(iter_xml(self.model.getroot(), prepared)),
+                         scanned)
+        for note in prepared.kept:
+            self.assertEqual(note.get('_node_type'), TEXT)
+            self.assertTrue(10 <= note_value(note, PAGE) <= 20)
+            self.assertTrue(note_value(note, LOCATION) <= 150)
+
+if __name__ == '__main__':
+    unittest.main()
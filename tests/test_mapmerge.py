@@ -0,0 +1,42 @@
+import unittest
+import xml.etree.ElementTree as ET
+
+from builders.mapbuilders import FreeMapBuilder
+from builders.mapmerge import merge_maps
+
+
+def build(sections):
+    """Return an internal map of sections: (title, [(heading, text)])."""
+    builder = FreeMapBuilder(ids='hash', now=0)
+    builder.XMLroot()
+    builder.bookTitle('Book')
+    for title, notes in sections:
+        builder.sectionHeading(title)
+        for heading, text in notes:
+            builder.noteHeading(heading)
+            builder.noteText(text)
+    return builder.get_document()
+
+
+class MergeMapsTest(unittest.TestCase):
+
+    def test_new_map_unchanged(self):
+        existing = build([('Preface', [('Page 1', 'one')])])
+        new = build([('Introduction', [('Page 2', 'two')]),
+                     ('Chapter', [('Page 3', 'three')])])
+        before = ET.tostring(new.getroot())
+        added = merge_maps(existing, new)
+        self.assertEqual(added, (2, 2))
+        self.assertEqual(ET.tostring(new.getroot()), before)
+
+    def test_new_sections_numbered_after_existing(self):
+        existing = build([('Preface', [('Page 1', 'one')])])
+        new = build([('Introduction', [('Page 2', 'two')])])
+        merge_maps(existing, new)
+        texts = [e.get('TEXT') for e in existing.iter('node')
+                 if e.get('_node_type') == 'section']
+        self.assertEqual(texts, ['0 Preface', '1 Introduction'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from builders.mapbuilders import NotesParser, explore
+from builders.mapcache import MapCache
+from builders.mapexporters import EXPORTERS, export, exporter
+from builders.mapfilters import MapFilter
+from builders.mapmodel import MapModel, ModelBuilder
+from builders.mappositions import LOCATION, note_value
+
+NOTES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'notes.html')
+
+
+def read(file):
+    with open(file, encoding='utf-8') as f:
+        return f.read()
+
+
+class MapModelTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        options = {'stream': True, 'ids': 'hash', 'now': 0, 'dedupe': True}
+        cls.tree = NotesParser(**options).parse(NOTES)
+        cls.model = NotesParser(builder=ModelBuilder, **options).parse(NOTES)
+
+    def test_export_as_tree(self):
+        for options in ({}, {'pages': False}, {'summary': True},
+                        {'page_range': ('10', '20'), 'level_low': 3},
+                        {'section_range': (2, 3)}):
+            with tempfile.TemporaryDirectory() as tmp:
+                for name, document in (('tree', self.tree),
+                                       ('model', self.model)):
+                    export(document, [exporter(f, os.path.join(
+                        tmp, f'{name}.{f}')) for f in EXPORTERS],
+                        MapFilter(**options))
+                for f in EXPORTERS:
+                    self.assertEqual(
+                        read(os.path.join(tmp, f'model.{f}')),
+                        read(os.path.join(tmp, f'tree.{f}')), (options, f))
+
+    def test_native_integers(self):
+        self.assertIsInstance(self.model, MapModel)
+        notes = [e for e in self.model.iter('node')
+                 if e.get('_node_type') == 'text']
+        self.assertIsInstance(note_value(notes[0], LOCATION), int)
+        self.assertIsInstance(notes[0].get('_node_level'), int)
+        self.assertEqual(explore(self.model, text=False),
+                         explore(self.tree, text=False))
+        stats = self.model.book.stats()
+        self.assertEqual(stats['notes'], len(notes))
+
+    def test_cache_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = MapCache(tmp)
+            cache.put('key', self.model)
+            model = ModelBuilder.load(cache.get('key'))
+            for name, document in (('cached', model), ('tree', self.tree)):
+                export(document, [exporter('mm', os.path.join(
+                    tmp, f'{name}.mm'))])
+            self.assertEqual(read(os.path.join(tmp, 'cached.mm')),
+                             read(os.path.join(tmp, 'tree.mm')))
+
+
+if __name__ == '__main__':
+    unittest.main()
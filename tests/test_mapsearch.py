@@ -0,0 +1,89 @@
+import os
+import tempfile
+import unittest
+
+from builders.mapsearch import NotesIndex, match_query
+
+
+def write_notes(file, sections):
+    """Write a Kindle notes file of the sections, (title, notes) pairs."""
+    divs = ['<html><body><div class="bookTitle">Book</div>']
+    for title, notes in sections:
+        divs.append(f'<div class="sectionHeading">{title}</div>')
+        for location, text in enumerate(notes, 1):
+            divs.append('<div class="noteHeading">Highlight (yellow) - '
+                        f'Page 1 · Location {location}</div>')
+            divs.append(f'<div class="noteText">{text}</div>')
+    divs.append('</body></html>')
+    with open(file, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(divs))
+
+
+class MatchQueryTest(unittest.TestCase):
+
+    def test_terms_quoted(self):
+        self.assertEqual(match_query('fox AND dog*'), '"fox" "AND" "dog*"')
+
+    def test_phrase(self):
+        self.assertEqual(match_query('fox "lazy  dog" river'),
+                         '"fox" "lazy  dog" "river"')
+        self.assertEqual(match_query('fox "lazy dog'), '"fox" "lazy dog"')
+        self.assertEqual(match_query(' "" '), '')
+
+
+class NotesIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.tmp.name, 'notes.html')
+        self.index = NotesIndex(os.path.join(self.tmp.name, 'index.sqlite'))
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def texts(self, query):
+        return [r['text'] for r in self.index.search(query)]
+
+    def test_incremental(self):
+        write_notes(self.file, [('Chapter', ['the lazy dog', 'a fox'])])
+        self.assertEqual(self.index.add_file(self.file), 2)
+        # Unchanged content: skipped
+        self.assertIsNone(self.index.add_file(self.file))
+        write_notes(self.file, [('Chapter', ['the quick cat'])])
+        self.assertEqual(self.index.add_file(self.file), 1)
+        self.assertEqual(self.texts('dog'), [])
+        self.assertEqual(self.texts('cat'), ['the quick cat'])
+        self.assertEqual(self.index.files(),
+                         [(os.path.abspath(self.file), 'Book', 1)])
+
+    def test_phrase_and_terms(self):
+        write_notes(self.file, [('Chapter', ['the lazy dog sleeps',
+                                             'the dog is not lazy'])])
+        self.index.add_file(self.file)
+        self.assertEqual(self.texts('"lazy dog"'), ['the lazy dog sleeps'])
+        self.assertEqual(sorted(self.texts('lazy dog')),
+                         ['the dog is not lazy', 'the lazy dog sleeps'])
+        # FTS5 operators are searched as words
+        self.assertEqual(self.texts('dog NOT'), ['the dog is not lazy'])
+
+    def test_ranking(self):
+        write_notes(self.file, [
+            ('River', ['a note about nothing']),
+            ('Chapter', ['a long note about the river and many other words '
+                         'around it', 'river river']),
+        ])
+        self.index.add_file(self.file)
+        # The note text weighs more than the section title, and the
+        # shorter, denser text ranks first
+        self.assertEqual(self.texts('river'), [
+            'river river',
+            'a long note about the river and many other words around it',
+            'a note about nothing'])
+        results = self.index.search('note')
+        ranks = [r['rank'] for r in results]
+        self.assertEqual(ranks, sorted(ranks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+
+from builders.mapbuilders import NotesParser
+from builders.mapcache import MapCache
+from builders.mapfilters import MapFilter
+from builders.mapwriters import write_document, write_notes
+
+NOTES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'notes.html')
+
+
+def read(file):
+    with open(file, encoding='utf-8') as f:
+        return f.read()
+
+
+class WriteNotesTest(unittest.TestCase):
+
+    def test_cache_miss_and_hit_as_write_document(self):
+        skip = MapFilter(pages=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            expected = os.path.join(tmp, 'expected.mm')
+            write_document(NotesParser(stream=True, ids='hash', now=0)
+                           .parse(NOTES), expected, skip=skip)
+            cache = MapCache(os.path.join(tmp, 'cache'))
+            for _ in ('miss', 'hit'):
+                mm = os.path.join(tmp, 'notes.mm')
+                parser = NotesParser(stream=True, ids='hash', now=0,
+                                     cache=cache)
+                self.assertIsNotNone(write_notes(parser, NOTES, mm, skip))
+                self.assertEqual(read(mm), read(expected))
+            self.assertEqual(len(cache.entries()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()